@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class HeyurlConfig(AppConfig):
     name = 'heyurl'
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+        from .instrumentation import instrument_connection
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='heyurl.db.configure_sqlite_connection')
+        connection_created.connect(instrument_connection, dispatch_uid='heyurl.instrumentation.instrument_connection')
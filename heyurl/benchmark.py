@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from typing import Callable, Dict, List
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from heyurl.models import Browser, Click, Platform, Url
+from heyurl.services import backfill_click_rollups, click_pipeline, increment_clicks, shorten_urls
+
+# Latency, throughput and query counts of a scenario
+BenchmarkResult = namedtuple('BenchmarkResult', ['scenario', 'requests', 'p50_ms', 'p99_ms', 'throughput',
+                                                 'queries_per_request'])
+
+# Number of popular urls receiving most of the redirects
+HOT_URLS = 100
+
+USER_AGENTS = [
+    ('Chrome', 'Windows', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/118.0.0.0 Safari/537.36'),
+    ('Safari', 'Mac OS X', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+                           'Version/17.0 Safari/605.1.15'),
+    ('Firefox', 'Linux', 'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/118.0'),
+]
+
+
+def seed(urls: int, clicks: int, seed_value: int = 0) -> List[str]:
+    """
+    Store urls and spread clicks over them during the current month
+    :param urls: number of urls to store
+    :param clicks: number of clicks to spread over the urls
+    :param seed_value: of the random distribution of the clicks
+    :return: list of the short urls
+    """
+    generator = random.Random(seed_value)
+    results = shorten_urls(['https://www.example.com/benchmark/{}'.format(index) for index in range(urls)])
+    url_ids = [result.url.id for result in results]
+
+    browser_ids = Browser.intern_many(browser for browser, _, _ in USER_AGENTS)
+    platform_ids = Platform.intern_many(platform for _, platform, _ in USER_AGENTS)
+
+    now = timezone.now()
+    first_day = timezone.localtime(now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    span = max((now - first_day).total_seconds(), 1)
+
+    batch = []
+    counts = Counter()
+    for _ in range(clicks):
+        url_id = generator.choice(url_ids)
+        browser, platform, _ = generator.choice(USER_AGENTS)
+        created_at = first_day + timezone.timedelta(seconds=generator.random() * span)
+        batch.append(Click(url_id=url_id, browser_id=browser_ids[browser], platform_id=platform_ids[platform],
+                           created_at=created_at, updated_at=created_at, month=Click.month_of(created_at)))
+        counts[url_id] += 1
+    Click.objects.bulk_create(batch, batch_size=1000)
+
+    increment_clicks(counts)
+    backfill_click_rollups(first_day.date())
+    return [result.url.short_url for result in results]
+
+
+def warm_caches(short_urls: List[str]):
+    """
+    Resolve every short url, so the scenarios measure the warm resolution cache and short code filter
+    :param short_urls: requested by the scenarios
+    """
+    for short_url in short_urls:
+        Url.resolve(short_url)
+
+
+def _percentile(latencies: List[float], percent: float) -> float:
+    # Nearest rank percentile of the sorted latencies
+    index = max(int(round(percent / 100 * len(latencies))) - 1, 0)
+    return latencies[min(index, len(latencies) - 1)]
+
+
+def scenarios(short_urls: List[str]) -> Dict[str, Callable[[Client, int], object]]:
+    """
+    Get the requests of every scenario
+    :param short_urls: to request
+    :return: dict: name -> function sending the request number n of the scenario with a client
+    """
+    # The redirects are skewed towards popular urls, like the real traffic
+    popular = short_urls[:HOT_URLS]
+    created = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def new_original_url():
+        with lock:
+            return 'https://www.example.com/benchmark/new/{}-{}'.format(time.time_ns(), next(created))
+
+    def redirect(client, n):
+        # One redirect out of ten is to any url
+        short_url = short_urls[n % len(short_urls)] if n % 10 == 0 else popular[n % len(popular)]
+        return client.get(reverse('short_url', kwargs={'short_url': short_url}),
+                          HTTP_USER_AGENT=USER_AGENTS[n % len(USER_AGENTS)][2])
+
+    return {
+        'redirect': redirect,
+        'create': lambda client, n: client.post(reverse('store'), {'original_url': new_original_url()}),
+        'index': lambda client, n: client.get(reverse('index')),
+        'metric_panel': lambda client, n: client.get(
+            reverse('metric-panel', kwargs={'short_url': short_urls[n % len(short_urls)]})
+        ),
+        'urls_api': lambda client, n: client.get(reverse('urls-list'), HTTP_ACCEPT='application/vnd.api+json'),
+    }
+
+
+def run_scenario(name: str, send: Callable[[Client, int], object], requests: int,
+                 concurrency: int = 1) -> BenchmarkResult:
+    """
+    Send the requests of a scenario and measure them
+
+    :param name: of the scenario
+    :param send: function sending the request number n with a client
+    :param requests: number of requests to send
+    :param concurrency: number of threads sending the requests, 1 sends them from the calling thread
+    :return: BenchmarkResult
+    """
+    latencies = []
+    queries = []
+    errors = []
+    numbers = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        while True:
+            with lock:
+                n = next(numbers, None)
+            if n is None:
+                return
+
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = send(client, n)
+                elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    def thread_worker():
+        try:
+            worker()
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=thread_worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Write the clicks recorded by the redirects, they are part of the scenario
+    click_pipeline.flush()
+
+    if errors:
+        raise RuntimeError('{} requests of the {} scenario failed with {}'.format(
+            len(errors), name, sorted(set(errors))
+        ))
+
+    latencies.sort()
+    return BenchmarkResult(
+        scenario=name,
+        requests=requests,
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        throughput=requests / elapsed if elapsed else 0.0,
+        queries_per_request=sum(queries) / len(queries) if queries else 0.0,
+    )
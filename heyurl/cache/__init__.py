@@ -0,0 +1,5 @@
+from .bloom_filter import BloomFilter
+from .lru_cache import LRUCache
+from .resolution import CACHE_MISS, ResolvedUrl, resolution_cache
+from .short_code_filter import ShortCodeFilter
+from .user_agents import UserAgentFamilies, user_agent_cache
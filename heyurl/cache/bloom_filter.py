@@ -0,0 +1,51 @@
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """
+    Probabilistic set answering whether an item may have been added, without false negatives
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        :param capacity: number of items the false positive rate is sized for
+        :param error_rate: false positive rate once capacity items are added, between 0 and 1
+        """
+        if capacity < 1:
+            raise ValueError('The capacity must be positive')
+        if not 0 < error_rate < 1:
+            raise ValueError('The error rate must be between 0 and 1')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item: str):
+        # Double hashing of one digest gives the hash_count positions
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, item: str):
+        """
+        Add an item to the set
+        :param item: to add
+        """
+        positions = self._positions(item)
+        # Setting the bits is a read-modify-write of their bytes, a concurrent add could undo it
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,102 @@
+from collections import namedtuple
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .lru_cache import LRUCache
+
+# Lightweight representation of a Url, enough to answer a redirect. A redirect_status of
+# None redirects with the default status, entries cached without it as well.
+ResolvedUrl = namedtuple('ResolvedUrl', ['id', 'short_url', 'original_url', 'redirect_status'], defaults=[None])
+
+# Returned by ResolutionCache.get when the short url is not cached
+CACHE_MISS = object()
+
+# Stored in the shared cache for short urls known to not exist
+_NOT_FOUND = 'not-found'
+
+
+class ResolutionCache:
+    """
+    Caches the short_url -> original_url resolution used by the redirect path.
+
+    Entries live in an in-process LRU and, when a cache alias is configured, in
+    Django's cache framework so every worker shares the resolutions. Unknown short
+    urls are cached as well (negative caching) with a shorter time to live.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float, cache_alias: Optional[str] = None):
+        """
+        :param max_size: maximum number of resolutions kept in memory
+        :param ttl: time to live of the resolutions in seconds
+        :param negative_ttl: time to live of the unknown short urls in seconds
+        :param cache_alias: Django cache alias used as a shared cache, None to disable it
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+        self.local = LRUCache(max_size, ttl)
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    @staticmethod
+    def _shared_key(short_url: str) -> str:
+        return 'heyurl:resolution:{}'.format(short_url)
+
+    def get(self, short_url: str, skip_local: bool = False):
+        """
+        Get the resolution of a short url
+        :param short_url: to resolve
+        :param skip_local: True when the in-process cache was already consulted, so its miss is counted once
+        :return: ResolvedUrl, None if the short url is known to not exist or CACHE_MISS
+        """
+        resolved = CACHE_MISS if skip_local else self.local.get(short_url, CACHE_MISS)
+        if resolved is not CACHE_MISS or self.shared is None:
+            return resolved
+
+        value = self.shared.get(self._shared_key(short_url))
+        if value is None:
+            return CACHE_MISS
+
+        # Promote the shared entry to the in-process cache
+        resolved = None if value == _NOT_FOUND else ResolvedUrl(*value)
+        self.local.set(short_url, resolved, self.ttl if resolved else self.negative_ttl)
+        return resolved
+
+    def set(self, short_url: str, resolved: Optional[ResolvedUrl]):
+        """
+        Store the resolution of a short url
+        :param short_url: resolved
+        :param resolved: ResolvedUrl or None if the short url does not exist
+        """
+        ttl = self.ttl if resolved else self.negative_ttl
+        self.local.set(short_url, resolved, ttl)
+        if self.shared is not None:
+            value = tuple(resolved) if resolved else _NOT_FOUND
+            self.shared.set(self._shared_key(short_url), value, ttl)
+
+    def invalidate(self, short_url: str):
+        """
+        Forget the resolution of a short url
+        :param short_url: to forget
+        """
+        self.local.delete(short_url)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(short_url))
+
+    def clear(self):
+        """
+        Forget every in-process resolution
+        """
+        self.local.clear()
+
+
+resolution_cache = ResolutionCache(
+    max_size=settings.HEYURL_RESOLUTION_CACHE['MAX_SIZE'],
+    ttl=settings.HEYURL_RESOLUTION_CACHE['TTL'],
+    negative_ttl=settings.HEYURL_RESOLUTION_CACHE['NEGATIVE_TTL'],
+    cache_alias=settings.HEYURL_RESOLUTION_CACHE['CACHE_ALIAS'],
+)
@@ -0,0 +1,191 @@
+import threading
+import time
+import uuid
+from typing import Callable, Iterable, Optional, Tuple
+
+from django.core.cache import caches
+
+from .bloom_filter import BloomFilter
+
+# Shared cache key of the generation of the filters, changed to have every process rebuild its filter
+_GENERATION_KEY = 'heyurl:short-code-filter:generation'
+
+# Shared cache key of the version of the short codes, incremented by the processes creating short codes
+_VERSION_KEY = 'heyurl:short-code-filter:version'
+
+
+class ShortCodeFilter:
+    """
+    Answers whether a short code may exist without querying the database.
+
+    The Bloom filter of the short codes is built lazily from the database, then the
+    codes created by the process are added as they are saved and the codes created
+    by the other processes are loaded incrementally, by id, at most once every
+    refresh interval when a code is not found. Deleted codes remain as false
+    positives until the filter is rebuilt.
+
+    With a shared cache, the processes publish a version of the short codes once they
+    have created some, and a missing code is answered from memory unless the version
+    has changed since the last load. Without one, or between two refreshes, a missing
+    code may have just been created by another process, so it is only known to not
+    exist if it cannot be created.
+    """
+
+    def __init__(self, load: Callable[[int], Iterable[Tuple[int, str]]], capacity: int, error_rate: float,
+                 refresh_interval: float, cache_alias: Optional[str] = None,
+                 creatable: Optional[Callable[[str], bool]] = None):
+        """
+        :param load: returns the (id, short_url) pairs with an id greater than its argument, by id
+        :param capacity: minimum number of short codes the filter is sized for
+        :param error_rate: false positive rate of the filter
+        :param refresh_interval: minimum seconds between two loads of the new short codes
+        :param cache_alias: Django cache alias sharing the rebuild requests between processes, None to disable it
+        :param creatable: returns if a short code can be created, None if any can be
+        """
+        self.load = load
+        self.creatable = creatable
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.cache_alias = cache_alias
+        self._bloom = None
+        self._watermark = 0
+        self._generation = None
+        self._version = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def might_exist(self, short_url: str) -> bool:
+        """
+        Check if a short code may exist
+        :param short_url: to check
+        :return: bool: False if the short code does not exist, True if it may exist
+        """
+        bloom = self._bloom
+        if bloom is None:
+            self.rebuild()
+            return short_url in self._bloom
+        if short_url in bloom:
+            return True
+
+        # The short code may have been created by another process since the last refresh
+        if self._refresh():
+            return short_url in self._bloom
+        return self.creatable is None or self.creatable(short_url)
+
+    def add(self, short_url: str):
+        """
+        Add a short code created by the process
+        :param short_url: created
+        """
+        bloom = self._bloom
+        if bloom is not None:
+            bloom.add(short_url)
+
+    def publish(self):
+        """
+        Have the processes sharing the cache load the short codes created by the process, once they are committed
+        """
+        shared = self.shared
+        if shared is None:
+            return
+
+        try:
+            shared.incr(_VERSION_KEY)
+        except ValueError:
+            # The version is missing, any value differs from the one the processes last loaded
+            shared.add(_VERSION_KEY, 1, None)
+
+    def rebuild(self):
+        """
+        Build the filter from every short code
+        """
+        with self._lock:
+            # Read the versions before the short codes, so the codes created meanwhile are loaded next time
+            generation, version = self._shared_versions()
+            bloom, watermark = self._build(self.capacity)
+
+            # Leave room to grow, the false positive rate is only met up to the capacity
+            if len(bloom) > bloom.capacity // 2:
+                bloom, watermark = self._build(len(bloom) * 2)
+
+            self._bloom, self._watermark = bloom, watermark
+            self._generation, self._version = generation, version
+            self._refreshed_at = time.monotonic()
+
+    def request_rebuild(self):
+        """
+        Have every process sharing the cache rebuild its filter at its next refresh
+        """
+        if self.shared is not None:
+            self.shared.set(_GENERATION_KEY, uuid.uuid4().hex, None)
+
+    def reset(self):
+        """
+        Forget the filter, it is built again when it is next used
+        """
+        with self._lock:
+            self._bloom = None
+            self._watermark = 0
+
+    def stats(self) -> dict:
+        """
+        :return: dict with the number of short codes, the size in bits and the hash count of the filter
+        """
+        bloom = self._bloom
+        if bloom is None:
+            return {'count': 0, 'size': 0, 'hash_count': 0}
+        return {'count': len(bloom), 'size': bloom.size, 'hash_count': bloom.hash_count}
+
+    def _shared_versions(self) -> Tuple[Optional[str], Optional[int]]:
+        if self.shared is None:
+            return None, None
+        versions = self.shared.get_many([_GENERATION_KEY, _VERSION_KEY])
+        return versions.get(_GENERATION_KEY), versions.get(_VERSION_KEY)
+
+    def _build(self, capacity: int):
+        bloom = BloomFilter(capacity, self.error_rate)
+        watermark = 0
+        for pk, short_url in self.load(0):
+            bloom.add(short_url)
+            watermark = pk
+        return bloom, watermark
+
+    def _refresh(self) -> bool:
+        """
+        Load the short codes created since the last refresh, unless it is too recent
+        :return: bool: if the filter holds every short code created before the call
+        """
+        generation, version = self._shared_versions()
+        if self.shared is not None and version == self._version and generation == self._generation:
+            # No short code was created since the last load
+            return True
+
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return False
+
+        if generation != self._generation:
+            self.rebuild()
+            return True
+
+        with self._lock:
+            # Another thread may have refreshed the filter in the meantime
+            if time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return True
+
+            self._refreshed_at = time.monotonic()
+            self._version = version
+            for pk, short_url in self.load(self._watermark):
+                self._bloom.add(short_url)
+                self._watermark = max(self._watermark, pk)
+
+            bloom = self._bloom
+
+        # Grow the filter once it holds more short codes than it is sized for
+        if len(bloom) > bloom.capacity:
+            self.rebuild()
+        return True
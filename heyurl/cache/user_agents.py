@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from user_agents import parse
+
+from .lru_cache import LRUCache
+
+# Browser and platform families of a user agent
+UserAgentFamilies = namedtuple('UserAgentFamilies', ['browser', 'platform'])
+
+
+class UserAgentCache:
+    """
+    Memoizes the browser and platform families of the user agent strings.
+
+    Parsing a user agent runs the whole ua-parser regex battery, while a small set
+    of user agents makes most of the traffic, so the results are kept in an LRU
+    keyed by a hash of the raw user agent string.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        :param max_size: maximum number of user agents kept in memory
+        """
+        self.local = LRUCache(max_size)
+        self.parses = 0
+        self.parse_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_agent: str) -> bytes:
+        return hashlib.blake2b(user_agent.encode('utf-8', 'replace'), digest_size=16).digest()
+
+    def classify(self, user_agent: str) -> UserAgentFamilies:
+        """
+        Get the browser and platform families of a user agent
+        :param user_agent: raw User-Agent header
+        :return: UserAgentFamilies
+        """
+        key = self._key(user_agent)
+        families = self.local.get(key)
+        if families is None:
+            start = time.perf_counter()
+            parsed = parse(user_agent)
+            families = UserAgentFamilies(parsed.browser.family, parsed.os.family)
+            elapsed = time.perf_counter() - start
+
+            self.local.set(key, families)
+            with self._lock:
+                self.parses += 1
+                self.parse_seconds += elapsed
+        return families
+
+    def stats(self) -> dict:
+        """
+        :return: dict with the hits, misses and size of the cache, and the number and duration of the parses
+        """
+        return {'hits': self.local.hits, 'misses': self.local.misses, 'size': len(self.local),
+                'parses': self.parses, 'parse_seconds': self.parse_seconds}
+
+    def clear(self):
+        """
+        Forget every user agent
+        """
+        self.local.clear()
+        with self._lock:
+            self.parses = 0
+            self.parse_seconds = 0.0
+
+
+user_agent_cache = UserAgentCache(settings.HEYURL_USER_AGENT_CACHE_SIZE)
@@ -0,0 +1,2 @@
+from .routers import ReplicaRouter, reads_from_replica, replica_reads, stick_to_primary
+from .sqlite import apply_sqlite_pragmas, configure_sqlite_connection
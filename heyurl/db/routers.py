@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+# Set while the current request may read from the replica
+_replica_reads = ContextVar('heyurl_replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Route the reads of the block to the replica, if one is configured
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _replica_alias():
+    alias = settings.HEYURL_REPLICA['ALIAS']
+    if alias not in connections.databases:
+        return None
+
+    # A replica naming the primary database, such as a test mirror, is the primary itself
+    if connections[alias].settings_dict['NAME'] == connections['default'].settings_dict['NAME']:
+        return None
+    return alias
+
+
+def is_sticky(request) -> bool:
+    """
+    Check if the client has written recently, so it has to read its writes from the primary
+    :param request: HttpRequest
+    :return: bool
+    """
+    return settings.HEYURL_REPLICA['STICKY_COOKIE'] in request.COOKIES
+
+
+def stick_to_primary(response):
+    """
+    Make the next requests of the client read from the primary for a while, so it reads its writes
+    :param response: HttpResponse to the write
+    :return: the response
+    """
+    if _replica_alias() is not None:
+        response.set_cookie(settings.HEYURL_REPLICA['STICKY_COOKIE'], '1',
+                            max_age=settings.HEYURL_REPLICA['STICKY_SECONDS'], httponly=True, samesite='Lax')
+    return response
+
+
+def _streaming_replica_reads(iterator):
+    # The streamed content is generated after the view has returned
+    iterator = iter(iterator)
+    while True:
+        with replica_reads():
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def reads_from_replica(view):
+    """
+    Decorate a read only view to read from the replica, unless the client sticks to the primary
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if is_sticky(request):
+            return view(request, *args, **kwargs)
+
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+
+        if response.streaming:
+            response.streaming_content = _streaming_replica_reads(response.streaming_content)
+        return response
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of the replica_reads blocks to the HEYURL_REPLICA alias, every
+    other query goes to the default database. Both hold the same data, so relations
+    are allowed between them.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return _replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,28 @@
+from typing import Dict, Union
+
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(cursor, pragmas: Dict[str, Union[int, str]]):
+    """
+    Apply pragmas to a SQLite connection
+    :param cursor: of the connection
+    :param pragmas: name -> value of the pragmas to apply
+    """
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA {}={}'.format(name, value))
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Tune every new SQLite connection with the HEYURL_SQLITE_PRAGMAS setting.
+
+    Connected to the connection_created signal by the HeyurlConfig. The busy timeout
+    makes the writers wait for each other instead of failing with "database is locked",
+    and the WAL journal, when configured, lets the readers run alongside a writer.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor, settings.HEYURL_SQLITE_PRAGMAS)
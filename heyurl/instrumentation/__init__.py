@@ -0,0 +1,2 @@
+from .middleware import InstrumentationMiddleware, instrument_connection, registry
+from .registry import Counter, Histogram, Registry
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from heyurl.cache import resolution_cache, user_agent_cache
+
+from .registry import Counter, Registry
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'heyurl_request_duration_seconds', 'Duration of the requests by view and status code', ('view', 'status'),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+REQUEST_QUERIES = registry.histogram(
+    'heyurl_request_db_queries', 'Number of database queries per request by view', ('view',),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+QUERY_DURATION = registry.counter(
+    'heyurl_db_query_duration_seconds_total', 'Time spent in the database queries by view', ('view',),
+)
+
+# Queries run outside of a request, such as the click pipeline writes
+_NO_VIEW = 'none'
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Statistics of the current request, shared with the threads of its sync_to_async calls
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('heyurl_request_stats', default=None)
+
+
+def instrument_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries and their duration in the current request
+    """
+    stats = _request_stats.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        if stats is None:
+            QUERY_DURATION.inc((_NO_VIEW,), elapsed)
+        else:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Wrap the queries of every new connection, whichever thread the ORM runs them from.
+
+    Connected to the connection_created signal by the HeyurlConfig.
+    """
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
+
+
+@registry.collector
+def _cache_metrics():
+    hits = Counter('heyurl_cache_hits_total', 'Hits of the in-process caches', ('cache',))
+    misses = Counter('heyurl_cache_misses_total', 'Misses of the in-process caches', ('cache',))
+    for name, cache in [('resolution', resolution_cache.local), ('user_agent', user_agent_cache.local)]:
+        hits.inc((name,), cache.hits)
+        misses.inc((name,), cache.misses)
+
+    user_agents = user_agent_cache.stats()
+    parses = Counter('heyurl_user_agent_parses_total', 'Number of user agents parsed')
+    parses.inc(amount=user_agents['parses'])
+    parse_duration = Counter('heyurl_user_agent_parse_duration_seconds_total', 'Time spent parsing user agents')
+    parse_duration.inc(amount=user_agents['parse_seconds'])
+    return [hits, misses, parses, parse_duration]
+
+
+class InstrumentationMiddleware:
+    """
+    Records the duration and the database queries of every request by view.
+
+    Both sync and async capable, so the async redirect view is not moved to a thread.
+    The metrics are kept in memory by each process and served by the metrics view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the middleware as a coroutine function, as Django's MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _record(request, response, stats: RequestStats, elapsed: float):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+
+        REQUEST_DURATION.observe((view, str(response.status_code)), elapsed)
+        REQUEST_QUERIES.observe((view,), stats.queries)
+        QUERY_DURATION.inc((view,), stats.query_seconds)
@@ -0,0 +1,138 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Label values of a sample, in the order of the label names of its metric
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    return '{{{}}}'.format(','.join(pairs)) if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, by label values
+    """
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(self.label_names, labels), _format_value(value))
+                for labels, value in values]
+
+
+class Histogram:
+    """
+    Distribution of observations in cumulative buckets, by label values
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket, sum, count]
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[0][index] += 1
+                    break
+            values[1] += value
+            values[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(buckets), total, count))
+                            for labels, (buckets, total, count) in self._values.items())
+
+        samples = []
+        bucket_names = self.label_names + ('le',)
+        for labels, (buckets, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                samples.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(bucket_names, labels + (_format_value(bound),)), cumulative
+                ))
+            samples.append('{}_bucket{} {}'.format(self.name, _format_labels(bucket_names, labels + ('+Inf',)), count))
+            samples.append('{}_sum{} {}'.format(self.name, _format_labels(self.label_names, labels),
+                                                _format_value(total)))
+            samples.append('{}_count{} {}'.format(self.name, _format_labels(self.label_names, labels), count))
+        return samples
+
+
+class Registry:
+    """
+    Collection of the metrics of the process, rendered in the Prometheus text format.
+
+    Besides the metrics it records, the registry renders the samples of collectors,
+    functions called at render time to read the statistics kept elsewhere, such as
+    the hits of the caches.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...],
+                  buckets: Iterable[float]) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def collector(self, collect: Callable[[], Iterable]):
+        """
+        Register a function returning fresh metrics at every render
+        :param collect: returns an iterable of metrics
+        :return: the function, so it can decorate it
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        """
+        :return: str: every metric in the Prometheus text exposition format
+        """
+        lines = []
+        metrics = list(self._metrics)
+        for collect in self._collectors:
+            metrics.extend(collect())
+
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
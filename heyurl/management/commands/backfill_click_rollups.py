@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from heyurl.services import backfill_click_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily click rollups from the raw clicks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD), every day by default')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rollups inserted per query')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date formatted as YYYY-MM-DD')
+
+        created = backfill_click_rollups(since, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Created {} click rollups'.format(created)))
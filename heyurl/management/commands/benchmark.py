@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from heyurl.benchmark import run_scenario, scenarios, seed, warm_caches
+from heyurl.cache import resolution_cache
+from heyurl.models import Browser, Platform
+from heyurl.models.url import short_code_allocator
+from heyurl.services import click_pipeline
+
+SCENARIOS = ('redirect', 'create', 'index', 'metric_panel', 'urls_api')
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the redirect, create, listing and metric views on a throwaway database with warm caches, '
+            'reporting their latency, throughput and queries per request and failing past the '
+            'HEYURL_BENCHMARK_THRESHOLDS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--urls', type=int, default=1000, help='Number of urls seeded')
+        parser.add_argument('--clicks', type=int, default=20000, help='Number of clicks seeded')
+        parser.add_argument('--requests', type=int, default=500, help='Number of requests sent by scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of threads sending the requests')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run, may be repeated, every scenario by default')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random distribution of the clicks')
+        parser.add_argument('--no-thresholds', action='store_true', help='Only report the results')
+
+    def handle(self, *args, **options):
+        for option in ('urls', 'requests', 'concurrency'):
+            if options[option] < 1:
+                raise CommandError('--{} must be positive'.format(option))
+
+        # The query thresholds are met with every short url in the resolution cache
+        if not options['no_thresholds'] and options['urls'] > settings.HEYURL_RESOLUTION_CACHE['MAX_SIZE']:
+            raise CommandError('--urls must be at most the HEYURL_RESOLUTION_CACHE MAX_SIZE of {} to enforce the '
+                               'thresholds, use --no-thresholds'.format(settings.HEYURL_RESOLUTION_CACHE['MAX_SIZE']))
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            # A database file, unlike an in memory one, is shared by the threads of the concurrent requests
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self._benchmark(options)
+            finally:
+                click_pipeline.stop()
+                self._forget_cached_ids()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self._report(results)
+        if not options['no_thresholds']:
+            self._enforce_thresholds(results)
+
+    @staticmethod
+    def _forget_cached_ids():
+        # The in-process caches hold ids of the other database
+        resolution_cache.clear()
+        Browser.clear_cache()
+        Platform.clear_cache()
+        short_code_allocator.reset()
+
+    def _benchmark(self, options):
+        self._forget_cached_ids()
+        short_urls = seed(options['urls'], options['clicks'], options['seed'])
+        warm_caches(short_urls)
+
+        requests = scenarios(short_urls)
+        return [
+            run_scenario(name, requests[name], options['requests'], options['concurrency'])
+            for name in options['scenario'] or SCENARIOS
+        ]
+
+    def _report(self, results):
+        self.stdout.write('{:<14}{:>10}{:>10}{:>10}{:>12}{:>10}'.format(
+            'scenario', 'requests', 'p50 ms', 'p99 ms', 'req/s', 'queries'
+        ))
+        for result in results:
+            self.stdout.write('{:<14}{:>10}{:>10.2f}{:>10.2f}{:>12.1f}{:>10.2f}'.format(*result))
+
+    def _enforce_thresholds(self, results):
+        failures = []
+        for result in results:
+            thresholds = settings.HEYURL_BENCHMARK_THRESHOLDS.get(result.scenario, {})
+            if 'P99_MS' in thresholds and result.p99_ms > thresholds['P99_MS']:
+                failures.append('{} p99 of {:.2f} ms is over {} ms'.format(
+                    result.scenario, result.p99_ms, thresholds['P99_MS']
+                ))
+            if 'QUERIES' in thresholds and result.queries_per_request > thresholds['QUERIES']:
+                failures.append('{} runs {:.2f} queries per request, over {}'.format(
+                    result.scenario, result.queries_per_request, thresholds['QUERIES']
+                ))
+
+        if failures:
+            raise CommandError('Benchmark thresholds exceeded:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every benchmark threshold is met'))
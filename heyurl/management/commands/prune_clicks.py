@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from heyurl.services import prune_clicks, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Delete the raw clicks older than the retention, their counts are kept by the daily rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Number of days of raw clicks to retain, '
+                                                     'the HEYURL_CLICK_RETENTION days by default')
+        parser.add_argument('--batch-size', type=int, help='Number of clicks deleted per transaction')
+        parser.add_argument('--pause', type=float, help='Seconds to sleep between the batches')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        cutoff = retention_cutoff(options['days'])
+        if cutoff is None:
+            self.stdout.write('The raw clicks are retained forever')
+            return
+
+        pruned = prune_clicks(options['days'], options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS('Deleted {} clicks older than {}'.format(
+            pruned, cutoff.date().isoformat()
+        )))
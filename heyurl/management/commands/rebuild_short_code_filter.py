@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from heyurl.models.url import short_code_filter
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the Bloom filter of the short urls, dropping the deleted ones, and have every process '
+            'sharing the HEYURL_SHORT_CODE_FILTER cache alias rebuild its own at its next refresh')
+
+    def handle(self, *args, **options):
+        short_code_filter.rebuild()
+        short_code_filter.request_rebuild()
+
+        stats = short_code_filter.stats()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt the short code filter with {count} short urls in {size} bits and {hash_count} hashes'.format(
+                **stats
+            )
+        ))
+
+        if short_code_filter.shared is None:
+            self.stdout.write(self.style.WARNING(
+                'HEYURL_SHORT_CODE_FILTER has no CACHE_ALIAS, the server processes keep their filter until '
+                'they restart'
+            ))
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.9 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortUrlSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.9 on 2026-10-18 15:55
+
+import random
+import string
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+
+
+def merge_duplicate_urls(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    urls = apps.get_model('heyurl', 'Url').objects.using(db_alias)
+    clicks = apps.get_model('heyurl', 'Click').objects.using(db_alias)
+
+    # Keep the first url of every duplicated original url, it takes over the clicks of the others
+    duplicates = list(urls.values('original_url').annotate(count=Count('id'), first_id=Min('id'))
+                      .filter(count__gt=1).values_list('original_url', 'first_id'))
+    for original_url, first_id in duplicates:
+        ids = list(urls.filter(original_url=original_url).exclude(id=first_id).values_list('id', flat=True))
+        clicks.filter(url_id__in=ids).update(url_id=first_id)
+        merged_clicks = urls.filter(id__in=ids).aggregate(total=Sum('clicks'))['total'] or 0
+        urls.filter(id=first_id).update(clicks=F('clicks') + merged_clicks)
+        urls.filter(id__in=ids).delete()
+
+    # Give a new short url to the later urls sharing one, the random short urls of up to 5 characters
+    # were only checked for uniqueness by the application
+    taken = set(urls.values_list('short_url', flat=True))
+    duplicates = list(urls.values('short_url').annotate(count=Count('id'), first_id=Min('id'))
+                      .filter(count__gt=1).values_list('short_url', 'first_id'))
+    for short_url, first_id in duplicates:
+        for pk in urls.filter(short_url=short_url).exclude(id=first_id).values_list('id', flat=True):
+            # 6 characters never clash with the former short urls nor with the allocated ones
+            new_short_url = short_url
+            while new_short_url in taken:
+                new_short_url = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+            taken.add(new_short_url)
+            urls.filter(id=pk).update(short_url=new_short_url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0002_short_url_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='url',
+            name='original_url',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='url',
+            name='short_url',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['url', 'created_at'], name='heyurl_clic_url_id_636ac1_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.9 on 2026-10-18 15:56
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_click_rollups(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Click = apps.get_model('heyurl', 'Click')
+    ClickRollup = apps.get_model('heyurl', 'ClickRollup')
+
+    groups = (Click.objects.using(db_alias)
+              .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+              .values('url_id', 'day', 'browser', 'platform').annotate(count=Count('id')).order_by())
+    ClickRollup.objects.using(db_alias).bulk_create((ClickRollup(**group) for group in groups.iterator()),
+                                                    batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0003_unique_short_and_original_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('browser', models.CharField(max_length=255)),
+                ('platform', models.CharField(max_length=255)),
+                ('count', models.IntegerField(default=0)),
+                ('url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='heyurl.url')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='clickrollup',
+            constraint=models.UniqueConstraint(fields=('url', 'day', 'browser', 'platform'), name='unique_click_rollup'),
+        ),
+        migrations.RunPython(backfill_click_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0004_click_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['created_at', 'id'], name='heyurl_url_created_82725f_idx'),
+        ),
+    ]
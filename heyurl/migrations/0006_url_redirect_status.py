@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0005_url_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='url',
+            name='redirect_status',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(301, 'Moved Permanently'), (302, 'Found'), (307, 'Temporary Redirect'), (308, 'Permanent Redirect')], null=True),
+        ),
+    ]
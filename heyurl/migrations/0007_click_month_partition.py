@@ -0,0 +1,41 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:08
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_click_months(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Click = apps.get_model('heyurl', 'Click')
+
+    # Group the clicks by the month of their created_at in the current timezone
+    months = defaultdict(list)
+    for pk, created_at in Click.objects.using(db_alias).values_list('id', 'created_at').iterator(chunk_size=2000):
+        local = timezone.localtime(created_at)
+        months[local.year * 100 + local.month].append(pk)
+
+    for month, pks in months.items():
+        for start in range(0, len(pks), 500):
+            Click.objects.using(db_alias).filter(id__in=pks[start:start + 500]).update(month=month)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0006_url_redirect_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='click',
+            name='month',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_click_months, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['month', 'created_at'], name='heyurl_clic_month_5f5545_idx'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Models referencing the browser and platform families
+REFERENCING_MODELS = ('Click', 'ClickRollup')
+
+
+def intern_user_agent_families(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    for family, model_name in [('browser', 'Browser'), ('platform', 'Platform')]:
+        Family = apps.get_model('heyurl', model_name)
+
+        names = set()
+        for referencing in REFERENCING_MODELS:
+            Model = apps.get_model('heyurl', referencing)
+            names.update(Model.objects.using(db_alias).values_list(family, flat=True).distinct())
+        Family.objects.using(db_alias).bulk_create([Family(name=name) for name in sorted(names)], batch_size=500)
+
+        # One update per family name
+        for pk, name in Family.objects.using(db_alias).values_list('id', 'name'):
+            for referencing in REFERENCING_MODELS:
+                Model = apps.get_model('heyurl', referencing)
+                Model.objects.using(db_alias).filter(**{family: name}).update(**{family + '_family_id': pk})
+
+
+def restore_user_agent_family_names(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    for family, model_name in [('browser', 'Browser'), ('platform', 'Platform')]:
+        Family = apps.get_model('heyurl', model_name)
+        for pk, name in Family.objects.using(db_alias).values_list('id', 'name'):
+            for referencing in REFERENCING_MODELS:
+                Model = apps.get_model('heyurl', referencing)
+                Model.objects.using(db_alias).filter(**{family + '_family_id': pk}).update(**{family: name})
+
+
+def family_reference(model_name, null):
+    return models.ForeignKey(null=null, on_delete=django.db.models.deletion.PROTECT, to='heyurl.' + model_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heyurl', '0007_click_month_partition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Browser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Platform',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='clickrollup',
+            name='unique_click_rollup',
+        ),
+    ] + [
+        migrations.AddField(
+            model_name=model_name.lower(),
+            name=family + '_family',
+            field=family_reference(family.capitalize(), null=True),
+        ) for model_name in REFERENCING_MODELS for family in ('browser', 'platform')
+    ] + [
+        migrations.RunPython(intern_user_agent_families, restore_user_agent_family_names),
+    ] + [
+        operation for model_name in REFERENCING_MODELS for family in ('browser', 'platform') for operation in [
+            # The default lets the names be restored when the migration is reversed
+            migrations.AlterField(
+                model_name=model_name.lower(),
+                name=family,
+                field=models.CharField(default='', max_length=255),
+            ),
+            migrations.RemoveField(
+                model_name=model_name.lower(),
+                name=family,
+            ),
+            migrations.RenameField(
+                model_name=model_name.lower(),
+                old_name=family + '_family',
+                new_name=family,
+            ),
+            migrations.AlterField(
+                model_name=model_name.lower(),
+                name=family,
+                field=family_reference(family.capitalize(), null=False),
+            ),
+        ]
+    ] + [
+        migrations.AddConstraint(
+            model_name='clickrollup',
+            constraint=models.UniqueConstraint(fields=('url', 'day', 'browser', 'platform'),
+                                               name='unique_click_rollup'),
+        ),
+    ]
@@ -1,2 +1,5 @@
 from .click import Click
+from .click_rollup import ClickRollup, RollupKey
+from .short_url_sequence import ShortUrlSequence
 from .url import Url
+from .user_agent_family import Browser, Platform, UserAgentFamily
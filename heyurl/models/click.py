@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
+from .click_rollup import ClickRollup, RollupKey
 from .url import Url
+from .user_agent_family import Browser, Platform
 
 
 class Click(models.Model):
@@ -10,8 +13,41 @@ class Click(models.Model):
     class JSONAPIMeta:
         resource_name = "metrics"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['url', 'created_at']),
+            # The retention prunes the clicks partition by partition
+            models.Index(fields=['month', 'created_at']),
+        ]
+
     url = models.ForeignKey(Url, on_delete=models.CASCADE)
-    browser = models.CharField(max_length=255)
-    platform = models.CharField(max_length=255)
+    browser = models.ForeignKey(Browser, on_delete=models.PROTECT)
+    platform = models.ForeignKey(Platform, on_delete=models.PROTECT)
     created_at = models.DateTimeField('date created')
     updated_at = models.DateTimeField('date updated')
+    # Partition key, the YYYYMM month of created_at in the current timezone
+    month = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def month_of(created_at) -> int:
+        """
+        Get the partition key of a click
+        :param created_at: of the click
+        :return: int: the YYYYMM month of created_at in the current timezone
+        """
+        local = timezone.localtime(created_at)
+        return local.year * 100 + local.month
+
+    @property
+    def rollup_key(self) -> RollupKey:
+        return RollupKey(self.url_id, timezone.localdate(self.created_at), self.browser_id, self.platform_id)
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        adding = self._state.adding
+        self.month = Click.month_of(self.created_at)
+        with transaction.atomic(using=using):
+            super().save(force_insert, force_update, using, update_fields)
+
+            # Count the new click in its rollup
+            if adding:
+                ClickRollup.increment({self.rollup_key: 1})
@@ -0,0 +1,45 @@
+from collections import namedtuple
+from typing import Mapping
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from .url import Url
+from .user_agent_family import Browser, Platform
+
+# Identifies the rollup a click is counted in
+RollupKey = namedtuple('RollupKey', ['url_id', 'day', 'browser_id', 'platform_id'])
+
+
+class ClickRollup(models.Model):
+    """
+    Keeps the number of clicks on a short URL per day, browser and platform
+    """
+    url = models.ForeignKey(Url, on_delete=models.CASCADE)
+    day = models.DateField('day')
+    browser = models.ForeignKey(Browser, on_delete=models.PROTECT)
+    platform = models.ForeignKey(Platform, on_delete=models.PROTECT)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['url', 'day', 'browser', 'platform'], name='unique_click_rollup'),
+        ]
+
+    @staticmethod
+    def increment(counts: Mapping[RollupKey, int]):
+        """
+        Add clicks to the rollups, creating the missing ones
+        :param counts: number of clicks to add by rollup key
+        """
+        for key, count in sorted(counts.items()):
+            rollups = ClickRollup.objects.filter(**key._asdict())
+            if rollups.update(count=F('count') + count):
+                continue
+
+            try:
+                with transaction.atomic():
+                    ClickRollup.objects.create(count=count, **key._asdict())
+            except IntegrityError:
+                # The rollup was created concurrently
+                rollups.update(count=F('count') + count)
@@ -0,0 +1,28 @@
+from django.db import models, transaction
+from django.db.models import F
+
+
+class ShortUrlSequence(models.Model):
+    """
+    Keeps track of the next sequence number to encode as a short url
+    """
+    name = models.CharField(max_length=255, unique=True)
+    next_value = models.BigIntegerField(default=0)
+
+    @staticmethod
+    def lease(size: int, name: str = 'short_url') -> range:
+        """
+        Reserve a block of sequence numbers
+        :param size: number of sequence numbers to reserve
+        :param name: of the sequence
+        :return: range of the reserved sequence numbers
+        """
+        with transaction.atomic():
+            # The update locks the sequence until the transaction ends
+            if not ShortUrlSequence.objects.filter(name=name).update(next_value=F('next_value') + size):
+                ShortUrlSequence.objects.get_or_create(name=name)
+                ShortUrlSequence.objects.filter(name=name).update(next_value=F('next_value') + size)
+
+            next_value = ShortUrlSequence.objects.filter(name=name).values_list('next_value', flat=True).get()
+
+        return range(next_value - size, next_value)
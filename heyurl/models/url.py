@@ -1,11 +1,17 @@
-import random
-import string
 from typing import Optional
 
+from django.conf import settings
 from django.core.validators import URLValidator
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.utils import timezone
 
+from heyurl.cache import CACHE_MISS, ResolvedUrl, ShortCodeFilter, resolution_cache
+from heyurl.short_codes import ShortCodeAllocator, is_short_code
+
+from .short_url_sequence import ShortUrlSequence
+
+short_code_allocator = ShortCodeAllocator(ShortUrlSequence.lease, settings.HEYURL_SHORT_URL_BLOCK_SIZE)
+
 
 class Url(models.Model):
     """
@@ -14,16 +20,33 @@ class Url(models.Model):
     class JSONAPIMeta:
         resource_name = "urls"
 
-    short_url = models.CharField(max_length=255)
-    original_url = models.CharField(max_length=255)
+    # Permanent redirects are cached by the browsers and edge caches, so only a sample of
+    # their clicks is tracked. Temporary redirects reach the server on every click.
+    REDIRECT_STATUS_CHOICES = [
+        (301, 'Moved Permanently'),
+        (302, 'Found'),
+        (307, 'Temporary Redirect'),
+        (308, 'Permanent Redirect'),
+    ]
+    PERMANENT_REDIRECT_STATUSES = (301, 308)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    short_url = models.CharField(max_length=255, unique=True)
+    original_url = models.CharField(max_length=255, unique=True)
     clicks = models.IntegerField(default=0)
+    # None redirects with the HEYURL_REDIRECT default status
+    redirect_status = models.PositiveSmallIntegerField(null=True, blank=True, choices=REDIRECT_STATUS_CHOICES)
     created_at = models.DateTimeField('date created')
     updated_at = models.DateTimeField('date updated')
 
     @staticmethod
     def is_valid_url(url) -> Optional[str]:
         """
-        Check if the url is valid and unique
+        Check if the url is valid, its uniqueness is enforced by the database when it is saved
         :param url: to validate
         :return: str: error message if not valid
         """
@@ -33,39 +56,97 @@ class Url(models.Model):
         except:
             return 'The Original URL is not valid!'
 
-        # check if the url is unique
-        if Url.objects.filter(original_url=url).exists():
-            return 'The Original URL already exists!'
-
     @staticmethod
     def generate_short_url():
         """
-        Generate a short url of max 5 characters
+        Generate a unique short url of 5 characters
         :return: str new short_url
         """
+        return short_code_allocator.allocate()
 
-        return ''.join(random.choices(string.ascii_letters + string.digits, k=random.randint(1, 5)))
+    @staticmethod
+    def resolve(short_url, skip_local: bool = False) -> Optional[ResolvedUrl]:
+        """
+        Resolve a short url, consulting the resolution cache before the database
+        :param short_url: to resolve
+        :param skip_local: True when the in-process resolution cache was already consulted
+        :return: ResolvedUrl or None if the short url does not exist
+        """
+        resolved = resolution_cache.get(short_url, skip_local)
+        if resolved is CACHE_MISS:
+            # Answer the short urls known to not exist, such as the ones probed by scanners, from memory
+            if settings.HEYURL_SHORT_CODE_FILTER['ENABLED'] and not short_code_filter.might_exist(short_url):
+                return None
 
-    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        # Check if it is a create and create a short_url
-        if not self.pk:
-            new_short_url = None
-            # Get all the short_urls
-            short_urls = list(Url.objects.values_list('short_url', flat=True))
-            while new_short_url is None:
-                short_url = Url.generate_short_url()
+            # Read from the primary, a lagging replica would cache a new short url as unknown
+            row = (Url.objects.using(router.db_for_write(Url)).filter(short_url=short_url)
+                   .values_list(*ResolvedUrl._fields).first())
+            resolved = ResolvedUrl(*row) if row else None
 
-                # Check if the short_url is unique
-                if short_url not in short_urls:
-                    new_short_url = short_url
+            # Cache the resolution, including the unknown short urls
+            resolution_cache.set(short_url, resolved)
 
-            # Set the short_url
-            self.short_url = new_short_url
+        return resolved
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # Check if it is a create and create a short_url
+        if not self.pk:
             # Set the created_at and updated_at fields
             self.created_at = self.updated_at = timezone.now()
+
+            while True:
+                # Set the short_url
+                self.short_url = Url.generate_short_url()
+                try:
+                    with transaction.atomic(using=using):
+                        super().save(force_insert, force_update, using, update_fields)
+                    short_code_filter.add(self.short_url)
+                    transaction.on_commit(short_code_filter.publish, using=using)
+                    break
+                except IntegrityError:
+                    # Allocate another short_url if it clashes with one generated at random before
+                    # the allocator existed, the original_url is not unique otherwise
+                    if not Url.objects.filter(short_url=self.short_url).exists():
+                        raise
         else:
             # Update the updated_at field
             self.updated_at = timezone.now()
 
-        super().save(force_insert, force_update, using, update_fields)
+            # The clicks counter is only written by the click counter, so don't write back
+            # a value that may be stale by now
+            if update_fields is None and not self._state.adding:
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key and field.name != 'clicks']
+
+            super().save(force_insert, force_update, using, update_fields)
+
+        # Forget any cached resolution of the short_url
+        resolution_cache.invalidate(self.short_url)
+
+    def delete(self, using=None, keep_parents=False):
+        short_url = self.short_url
+        result = super().delete(using, keep_parents)
+
+        # Forget any cached resolution of the short_url
+        resolution_cache.invalidate(short_url)
+        return result
+
+
+def _short_urls_after(pk: int):
+    """
+    Load the short urls to add to the short code filter, from the primary like the resolutions
+    :param pk: of the last url loaded
+    :return: iterator of the (id, short_url) pairs of the next urls, by id
+    """
+    return (Url.objects.using(router.db_for_write(Url)).filter(pk__gt=pk).order_by('pk')
+            .values_list('pk', 'short_url').iterator(chunk_size=2000))
+
+
+short_code_filter = ShortCodeFilter(
+    load=_short_urls_after,
+    capacity=settings.HEYURL_SHORT_CODE_FILTER['CAPACITY'],
+    error_rate=settings.HEYURL_SHORT_CODE_FILTER['ERROR_RATE'],
+    refresh_interval=settings.HEYURL_SHORT_CODE_FILTER['REFRESH_INTERVAL'],
+    cache_alias=settings.HEYURL_SHORT_CODE_FILTER['CACHE_ALIAS'],
+    creatable=is_short_code,
+)
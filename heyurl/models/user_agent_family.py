@@ -0,0 +1,67 @@
+from typing import Dict, Iterable
+
+from django.db import models, transaction
+
+
+class UserAgentFamily(models.Model):
+    """
+    Interned browser or platform family, the clicks and their rollups reference it by id
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    # name -> id of the committed families, kept in memory by each concrete model
+    _ids: Dict[str, int]
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def intern(cls, name: str) -> int:
+        """
+        Get the id of a family, creating it if it does not exist
+        :param name: of the family
+        :return: int: the id of the family
+        """
+        return cls.intern_many([name])[name]
+
+    @classmethod
+    def intern_many(cls, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Get the ids of families, creating the missing ones
+        :param names: of the families
+        :return: dict: name -> id of the families
+        """
+        names = set(names)
+        ids = {name: cls._ids[name] for name in names if name in cls._ids}
+
+        missing = names - ids.keys()
+        if missing:
+            found = dict(cls.objects.filter(name__in=missing).values_list('name', 'id'))
+            if missing - found.keys():
+                # Families created concurrently are ignored, then read back along with the new ones
+                cls.objects.bulk_create([cls(name=name) for name in missing - found.keys()], ignore_conflicts=True)
+                found = dict(cls.objects.filter(name__in=missing).values_list('name', 'id'))
+            ids.update(found)
+
+            # Only remember the ids once they are committed, a rolled back family has no id
+            transaction.on_commit(lambda: cls._ids.update(found))
+
+        return ids
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget every interned id
+        """
+        cls._ids.clear()
+
+
+class Browser(UserAgentFamily):
+    _ids = {}
+
+
+class Platform(UserAgentFamily):
+    _ids = {}
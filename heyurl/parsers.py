@@ -0,0 +1,35 @@
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api import exceptions
+from rest_framework_json_api.parsers import JSONParser
+from rest_framework_json_api.utils import get_resource_name
+
+
+class BulkJSONParser(JSONParser):
+    """
+    Parses a JSON:API document whose primary data is an array of resource objects
+    """
+
+    def parse_data(self, result, parser_context):
+        """
+        :return: list with the attributes of every resource object
+        """
+        if not isinstance(result, dict) or not isinstance(result.get('data'), list):
+            raise ParseError('Received document does not contain an array of primary data')
+
+        resource_name = get_resource_name(parser_context or {})
+
+        parsed_data = []
+        for data in result['data']:
+            if not isinstance(data, dict):
+                raise ParseError('Received data contains one or more malformed JSON:API Resource Object(s)')
+
+            if resource_name and data.get('type') != resource_name:
+                raise exceptions.Conflict(
+                    "The resource object's type ({data_type}) is not the type that constitute the collection "
+                    "represented by the endpoint ({resource_type}).".format(
+                        data_type=data.get('type'), resource_type=resource_name
+                    )
+                )
+            parsed_data.append(self.parse_attributes(data))
+
+        return parsed_data
@@ -6,4 +6,6 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('store', views.store, name='store'),
     path('metric-panel/<short_url>/', views.metric_panel, name='metric-panel'),
+    path('clicks/export', views.click_export, name='click-export'),
+    path('metrics', views.prometheus_metrics, name='prometheus-metrics'),
 ]
@@ -5,18 +5,56 @@ from heyurl.models import Url, Click
 
 
 class ClickSerializer(serializers.ModelSerializer):
+    browser = serializers.CharField(source='browser.name', read_only=True)
+    platform = serializers.CharField(source='platform.name', read_only=True)
+
     class Meta:
         model = Click
         fields = ('created_at', 'browser', 'platform')
 
 
+class MetricSerializer(serializers.Serializer):
+    """
+    Serializes the clicks of a url in a time bucket, the time range is rendered as the top level meta
+    """
+    date = serializers.SerializerMethodField()
+    count = serializers.IntegerField()
+
+    def get_date(self, instance):
+        return instance.date.isoformat()
+
+    def get_root_meta(self, resource, many):
+        metrics = self.context['metrics']
+        return {
+            'from': metrics.start.isoformat(),
+            'to': metrics.end.isoformat(),
+            'granularity': metrics.granularity,
+            'source': metrics.source,
+        }
+
+    class Meta:
+        resource_name = Click.JSONAPIMeta.resource_name
+
+
 class UrlSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField(read_only=True)
-    metrics = serializers.ResourceRelatedField(many=True, read_only=True, source='click_set')
+    # The latest clicks, prefetched by the UrlViewSet
+    metrics = serializers.ResourceRelatedField(many=True, read_only=True, source='recent_clicks', model=Click)
 
     def get_url(self, instace):
-        return "".join(["http://", Site.objects.get_current().domain, "/", instace.short_url])
+        # The site domain is resolved once per request by the UrlViewSet
+        domain = self.context.get('site_domain') or Site.objects.get_current().domain
+        return "".join(["http://", domain, "/", instace.short_url])
 
     class Meta:
         model = Url
         fields = ('created_at', 'original_url', 'url', 'clicks', 'metrics')
+
+
+class BulkUrlSerializer(UrlSerializer):
+    """
+    Serializes the urls of a bulk create, the per item results are rendered as the top level meta
+    """
+
+    def get_root_meta(self, resource, many):
+        return {'results': self.context.get('results', [])}
@@ -0,0 +1,8 @@
+from .bulk_shortener import ShortenResult, shorten_urls
+from .click_counter import increment_clicks
+from .click_export import export_csv, export_ndjson, export_rows
+from .click_pipeline import ClickEvent, click_pipeline
+from .click_retention import prune_clicks, retention_cutoff
+from .click_rollups import backfill_click_rollups
+from .metrics import GRANULARITIES, ClickMetrics, MetricBucket, user_agent_breakdown
+from .pagination import KeysetPage, paginate_by_created_at
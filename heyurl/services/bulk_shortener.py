@@ -0,0 +1,103 @@
+from collections import namedtuple
+from typing import List
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from heyurl.cache import resolution_cache
+from heyurl.models import Url
+from heyurl.models.url import short_code_allocator, short_code_filter
+
+# Outcome of shortening one original url, the url is None when the original url is invalid
+ShortenResult = namedtuple('ShortenResult', ['status', 'url', 'error'])
+
+CREATED = 'created'
+EXISTING = 'existing'
+INVALID = 'invalid'
+
+# Maximum length of an original url
+MAX_LENGTH = Url._meta.get_field('original_url').max_length
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate(original_url) -> str:
+    if not isinstance(original_url, str) or len(original_url) > MAX_LENGTH:
+        return 'The Original URL is not valid!'
+    return Url.is_valid_url(original_url)
+
+
+def shorten_urls(original_urls: list, batch_size: int = 500) -> List[ShortenResult]:
+    """
+    Shorten many original urls at once.
+
+    The original urls are validated in memory, deduplicated against the stored ones
+    with IN queries and the new urls get their short urls allocated in bulk before
+    being inserted with bulk_create.
+    :param original_urls: to shorten
+    :param batch_size: number of urls by query
+    :return: list of ShortenResult, in the order of the original urls
+    """
+    errors = {}
+    for original_url in original_urls:
+        key = original_url if isinstance(original_url, str) else repr(original_url)
+        if key not in errors:
+            errors[key] = _validate(original_url)
+    valid_urls = [original_url for original_url, error in errors.items() if error is None]
+
+    # Find the original urls which are already stored
+    existing = {}
+    for chunk in _chunks(valid_urls, batch_size):
+        existing.update((url.original_url, url) for url in Url.objects.filter(original_url__in=chunk))
+
+    new_urls = [original_url for original_url in valid_urls if original_url not in existing]
+    created = _create(new_urls, batch_size) if new_urls else {}
+
+    results = []
+    for original_url in original_urls:
+        key = original_url if isinstance(original_url, str) else repr(original_url)
+        if errors[key] is not None:
+            results.append(ShortenResult(INVALID, None, errors[key]))
+        elif key in created:
+            results.append(ShortenResult(CREATED, created[key], None))
+        else:
+            results.append(ShortenResult(EXISTING, existing.get(key) or Url.objects.get(original_url=key), None))
+    return results
+
+
+def _create(original_urls: List[str], batch_size: int) -> dict:
+    dt_now = timezone.now()
+    short_urls = short_code_allocator.allocate_many(len(original_urls))
+    urls = [
+        Url(original_url=original_url, short_url=short_url, created_at=dt_now, updated_at=dt_now)
+        for original_url, short_url in zip(original_urls, short_urls)
+    ]
+
+    try:
+        with transaction.atomic():
+            Url.objects.bulk_create(urls, batch_size=batch_size)
+    except IntegrityError:
+        # An original url was stored concurrently or a short url clashes with a legacy one,
+        # fall back to creating the urls one by one
+        created = {}
+        for original_url in original_urls:
+            try:
+                created[original_url] = Url.objects.create(original_url=original_url)
+            except IntegrityError:
+                pass
+        return created
+
+    for short_url in short_urls:
+        # Forget the short urls cached or filtered as unknown
+        resolution_cache.invalidate(short_url)
+        short_code_filter.add(short_url)
+    transaction.on_commit(short_code_filter.publish)
+
+    # Get the created urls back with their primary keys
+    created = {}
+    for chunk in _chunks(short_urls, batch_size):
+        created.update((url.original_url, url) for url in Url.objects.filter(short_url__in=chunk))
+    return created
@@ -0,0 +1,19 @@
+from typing import Mapping
+
+from django.db.models import F
+
+from heyurl.models import Url
+
+
+def increment_clicks(counts: Mapping[int, int]):
+    """
+    Atomically increment the clicks counter of the urls.
+
+    The increments are applied by the database (clicks = clicks + n), so concurrent
+    writers never lose updates, and only the clicks column is written. The urls are
+    updated in id order so concurrent batches always lock the rows in the same order.
+    :param counts: number of clicks to add by url id
+    """
+    for url_id, count in sorted(counts.items()):
+        if count:
+            Url.objects.filter(pk=url_id).update(clicks=F('clicks') + count)
@@ -0,0 +1,66 @@
+import csv
+import datetime
+import json
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+
+from heyurl.models import Click
+
+# Columns of the exported clicks
+EXPORT_FIELDS = ('id', 'short_url', 'browser', 'platform', 'created_at')
+
+
+class _Echo:
+    """
+    File-like object returning what is written to it, so the csv writer yields the rows
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(url_id: Optional[int] = None, start: Optional[datetime.datetime] = None,
+                end: Optional[datetime.datetime] = None) -> Iterator[tuple]:
+    """
+    Iterate over the clicks with a database cursor, without loading them in memory
+    :param url_id: only export the clicks of this url
+    :param start: only export the clicks created at or after
+    :param end: only export the clicks created before
+    :return: iterator of tuples with the EXPORT_FIELDS values
+    """
+    clicks = Click.objects.all()
+    if url_id is not None:
+        clicks = clicks.filter(url_id=url_id)
+    if start is not None:
+        clicks = clicks.filter(created_at__gte=start)
+    if end is not None:
+        clicks = clicks.filter(created_at__lt=end)
+
+    return (clicks.order_by('id')
+            .values_list('id', 'url__short_url', 'browser__name', 'platform__name', 'created_at')
+            .iterator(chunk_size=settings.HEYURL_CLICK_EXPORT_CHUNK_SIZE))
+
+
+def export_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    """
+    Format the clicks as newline delimited JSON
+    :param rows: from export_rows
+    :return: iterator of lines
+    """
+    for row in rows:
+        click = dict(zip(EXPORT_FIELDS, row))
+        click['created_at'] = click['created_at'].isoformat()
+        yield json.dumps(click) + '\n'
+
+
+def export_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    """
+    Format the clicks as CSV, with a header row
+    :param rows: from export_rows
+    :return: iterator of lines
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row[:-1] + (row[-1].isoformat(),))
@@ -0,0 +1,201 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, router, transaction
+from django.utils import timezone
+
+from heyurl.models import Browser, Click, ClickRollup, Platform, RollupKey, Url
+
+from .click_counter import increment_clicks
+
+logger = logging.getLogger(__name__)
+
+# Lightweight click recorded by the redirect path
+ClickEvent = namedtuple('ClickEvent', ['url_id', 'browser', 'platform', 'created_at'])
+
+# Asks the worker to drain the queue and exit
+_STOP = object()
+
+
+class ClickPipeline:
+    """
+    Ingests the clicks out of the redirect request.
+
+    The redirect only enqueues a ClickEvent; a background worker writes the Click
+    rows with bulk_create and applies the aggregated clicks counter and rollup
+    increments once FLUSH_SIZE events are queued or FLUSH_INTERVAL seconds have
+    elapsed. The queue is drained when the process exits.
+
+    The clicks of the urls deleted since they were queued are dropped. When a batch
+    cannot be written, its clicks are written again url by url so only the clicks of
+    the failing urls are lost.
+
+    When the ASYNC setting is disabled the events are written as they are recorded.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> dict:
+        return settings.HEYURL_CLICK_PIPELINE
+
+    def record(self, event: ClickEvent):
+        """
+        Record a click
+        :param event: the click to record
+        """
+        if not self.config['ASYNC']:
+            self._write([event])
+            return
+
+        self._start_worker()
+        self._queue.put(event)
+
+    async def arecord(self, event: ClickEvent):
+        """
+        Record a click from an async view, only the synchronous writes run in a thread
+        :param event: the click to record
+        """
+        if not self.config['ASYNC']:
+            await sync_to_async(self._write)([event])
+            return
+
+        # Enqueueing never blocks the event loop
+        self.record(event)
+
+    def flush(self) -> int:
+        """
+        Write every queued click from the calling thread
+        :return: int: number of clicks written
+        """
+        events = self._drain()
+        self._write_batches(events)
+        return len(events)
+
+    def stop(self, timeout: float = None):
+        """
+        Stop the worker after it has written every queued click
+        :param timeout: seconds to wait for the worker
+        """
+        with self._lock:
+            worker, self._worker = self._worker, None
+
+        if worker is not None and worker.is_alive():
+            self._queue.put(_STOP)
+            worker.join(timeout)
+        else:
+            self.flush()
+
+    def _start_worker(self):
+        if self._worker is not None:
+            return
+
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='heyurl-click-pipeline', daemon=True)
+                self._worker.start()
+                atexit.register(self.stop)
+
+    def _drain(self) -> List[ClickEvent]:
+        events = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return events
+            if event is not _STOP:
+                events.append(event)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.config['FLUSH_INTERVAL']
+
+            # Collect a batch until it is full or the flush interval has elapsed
+            while len(batch) < self.config['FLUSH_SIZE']:
+                try:
+                    event = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            if stopping:
+                batch.extend(self._drain())
+
+            if batch:
+                close_old_connections()
+                self._write_batches(batch)
+
+        connection.close()
+
+    def _write_batches(self, events: List[ClickEvent]):
+        for start in range(0, len(events), self.config['FLUSH_SIZE']):
+            batch = events[start:start + self.config['FLUSH_SIZE']]
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception('Unable to write %d clicks, writing them url by url', len(batch))
+                self._write_per_url(batch)
+
+    def _write_per_url(self, events: List[ClickEvent]):
+        events_per_url = defaultdict(list)
+        for event in events:
+            events_per_url[event.url_id].append(event)
+
+        for url_id, url_events in events_per_url.items():
+            try:
+                self._write(url_events)
+            except Exception:
+                logger.exception('Unable to write %d clicks of the url %s', len(url_events), url_id)
+
+    @staticmethod
+    def _write(events: List[ClickEvent]):
+        # Drop the clicks of the urls deleted since they were queued
+        url_ids = set(Url.objects.using(router.db_for_write(Url))
+                      .filter(pk__in={event.url_id for event in events}).values_list('id', flat=True))
+        events = [event for event in events if event.url_id in url_ids]
+        if not events:
+            return
+
+        with transaction.atomic():
+            # Reference the browser and platform families by id
+            browser_ids = Browser.intern_many(event.browser for event in events)
+            platform_ids = Platform.intern_many(event.platform for event in events)
+
+            Click.objects.bulk_create([
+                Click(
+                    url_id=event.url_id,
+                    browser_id=browser_ids[event.browser],
+                    platform_id=platform_ids[event.platform],
+                    created_at=event.created_at,
+                    updated_at=event.created_at,
+                    month=Click.month_of(event.created_at),
+                ) for event in events
+            ])
+
+            # Apply one counter increment per url
+            increment_clicks(Counter(event.url_id for event in events))
+
+            # Count the clicks in their rollups
+            ClickRollup.increment(Counter(
+                RollupKey(event.url_id, timezone.localdate(event.created_at),
+                          browser_ids[event.browser], platform_ids[event.platform])
+                for event in events
+            ))
+
+
+click_pipeline = ClickPipeline()
@@ -0,0 +1,60 @@
+import datetime
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from heyurl.models import Click
+
+
+def retention_cutoff(days: Optional[int] = None) -> Optional[datetime.datetime]:
+    """
+    Get the start of the first day whose raw clicks are retained
+    :param days: number of days of raw clicks to retain, the HEYURL_CLICK_RETENTION days by default
+    :return: the aware datetime or None if the raw clicks are retained forever
+    """
+    if days is None:
+        days = settings.HEYURL_CLICK_RETENTION['DAYS']
+    if days is None:
+        return None
+
+    first_day = timezone.localdate() - datetime.timedelta(days=days)
+    return timezone.make_aware(datetime.datetime.combine(first_day, datetime.time()))
+
+
+def prune_clicks(days: Optional[int] = None, batch_size: Optional[int] = None, pause: Optional[float] = None) -> int:
+    """
+    Delete the raw clicks older than the retention, their counts live on in the rollups.
+
+    The clicks are deleted in small transactions, oldest partitions first, so the
+    writers of the new clicks only ever wait for one batch.
+
+    :param days: number of days of raw clicks to retain, the HEYURL_CLICK_RETENTION days by default
+    :param batch_size: number of clicks deleted per transaction
+    :param pause: seconds to sleep between the batches
+    :return: int: number of clicks deleted
+    """
+    config = settings.HEYURL_CLICK_RETENTION
+    batch_size = config['BATCH_SIZE'] if batch_size is None else batch_size
+    pause = config['BATCH_PAUSE'] if pause is None else pause
+
+    cutoff = retention_cutoff(days)
+    if cutoff is None:
+        return 0
+
+    # Only scan the partitions up to the month of the cutoff
+    expired = (Click.objects.filter(month__lte=Click.month_of(cutoff), created_at__lt=cutoff)
+               .order_by('month', 'created_at'))
+
+    pruned = 0
+    while True:
+        with transaction.atomic():
+            pks = list(expired.values_list('id', flat=True)[:batch_size])
+            if not pks:
+                return pruned
+            pruned += Click.objects.filter(id__in=pks).delete()[0]
+
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,38 @@
+import datetime
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from heyurl.models import Click, ClickRollup
+
+from .click_retention import retention_cutoff
+
+
+def backfill_click_rollups(since: Optional[datetime.date] = None, batch_size: int = 1000) -> int:
+    """
+    Rebuild the click rollups from the raw clicks, the days whose raw clicks have been pruned are kept
+    :param since: first day to rebuild, None to rebuild every retained day
+    :param batch_size: number of rollups inserted per query
+    :return: int: number of rollups created
+    """
+    cutoff = retention_cutoff()
+    if cutoff is not None and (since is None or since < cutoff.date()):
+        since = cutoff.date()
+
+    rollups = ClickRollup.objects.all()
+    clicks = Click.objects.all()
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+        clicks = clicks.filter(created_at__gte=timezone.make_aware(datetime.datetime.combine(since, datetime.time())))
+
+    groups = (clicks.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+              .values('url_id', 'day', 'browser_id', 'platform_id').annotate(count=Count('id')).order_by())
+
+    with transaction.atomic():
+        rollups.delete()
+        created = ClickRollup.objects.bulk_create((ClickRollup(**group) for group in groups.iterator()),
+                                                  batch_size=batch_size)
+    return len(created)
@@ -0,0 +1,174 @@
+import datetime
+from collections import namedtuple
+from typing import List
+
+from django.conf import settings
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from heyurl.models import Click, ClickRollup
+
+# Browser and platform of the user agents past the top ones
+OTHER = 'Other'
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# Number of clicks in a time bucket, the pk identifies it as a JSON:API resource
+MetricBucket = namedtuple('MetricBucket', ['pk', 'date', 'count'])
+
+_TRUNCATE = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def user_agent_breakdown(rollups: QuerySet, limit: int, count=Sum('count')) -> List[dict]:
+    """
+    Count the clicks by browser and platform, keeping the top ones and bucketing the rest as other
+    :param rollups: ClickRollup queryset to break down
+    :param limit: number of browser and platform pairs to keep
+    :param count: aggregate counting the clicks, Count('id') to break down a Click queryset
+    :return: list of dicts with the browser, platform and count, most used first
+    """
+    # Group by the ids of the families, their names are only joined to be rendered
+    rows = (rollups.values('browser_id', 'platform_id')
+            .annotate(browser_name=F('browser__name'), platform_name=F('platform__name'), count=count)
+            .order_by('-count', 'browser_name', 'platform_name')[:limit])
+    breakdown = [{'browser': row['browser_name'], 'platform': row['platform_name'], 'count': row['count']}
+                 for row in rows]
+
+    # Only count the other user agents when the top ones may not be all of them
+    if len(breakdown) == limit:
+        total = rollups.aggregate(total=count)['total'] or 0
+        other = total - sum(item['count'] for item in breakdown)
+        if other:
+            breakdown.append({'browser': OTHER, 'platform': OTHER, 'count': other})
+
+    return breakdown
+
+
+def _bucket_start(value: datetime.datetime, granularity: str):
+    value = timezone.localtime(value)
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+
+    date = value.date()
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def _next_bucket(bucket, granularity: str):
+    if granularity == 'hour':
+        # Step in UTC so the daylight saving time changes neither skip nor repeat an hour
+        return timezone.localtime(bucket + datetime.timedelta(hours=1))
+    if granularity == 'week':
+        return bucket + datetime.timedelta(weeks=1)
+    if granularity == 'month':
+        return (bucket + datetime.timedelta(days=32)).replace(day=1)
+    return bucket + datetime.timedelta(days=1)
+
+
+class ClickMetrics:
+    """
+    Answers the click metrics of a url over a time range at a given granularity.
+
+    The daily rollups answer the ranges starting and ending at midnight, whatever
+    their length, while the hourly metrics and the ranges starting or ending within a
+    day are answered from the raw clicks.
+    """
+
+    def __init__(self, url_id: int, start: datetime.datetime, end: datetime.datetime, granularity: str = 'day'):
+        """
+        :param url_id: of the url
+        :param start: of the time range, included
+        :param end: of the time range, excluded
+        :param granularity: one of GRANULARITIES
+        :raise ValueError: if the time range or the granularity are not valid, or if the time range
+            has more than HEYURL_METRICS_MAX_BUCKETS buckets
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError('The granularity must be one of {}'.format(', '.join(GRANULARITIES)))
+        if start >= end:
+            raise ValueError('The time range must end after it starts')
+
+        self.url_id = url_id
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+
+        if self.bucket_count > settings.HEYURL_METRICS_MAX_BUCKETS:
+            raise ValueError('The time range must have at most {} buckets per {}, use a shorter time range or a '
+                             'coarser granularity'.format(settings.HEYURL_METRICS_MAX_BUCKETS, granularity))
+
+    @property
+    def bucket_count(self) -> int:
+        """
+        Number of time buckets of the series, counted without filling them
+        """
+        first_bucket = _bucket_start(self.start, self.granularity)
+        last_bucket = _bucket_start(self.end - datetime.timedelta(microseconds=1), self.granularity)
+        if self.granularity == 'hour':
+            return int((last_bucket - first_bucket).total_seconds() // 3600) + 1
+        if self.granularity == 'week':
+            return (last_bucket - first_bucket).days // 7 + 1
+        if self.granularity == 'month':
+            return (last_bucket.year - first_bucket.year) * 12 + last_bucket.month - first_bucket.month + 1
+        return (last_bucket - first_bucket).days + 1
+
+    @property
+    def uses_rollups(self) -> bool:
+        def is_midnight(value):
+            return timezone.localtime(value).time() == datetime.time()
+
+        return self.granularity != 'hour' and is_midnight(self.start) and is_midnight(self.end)
+
+    @property
+    def source(self) -> str:
+        return 'rollups' if self.uses_rollups else 'clicks'
+
+    def _queryset(self) -> QuerySet:
+        if self.uses_rollups:
+            return ClickRollup.objects.filter(url_id=self.url_id, day__gte=timezone.localdate(self.start),
+                                              day__lt=timezone.localdate(self.end))
+        return Click.objects.filter(url_id=self.url_id, created_at__gte=self.start, created_at__lt=self.end)
+
+    def _count(self):
+        return Sum('count') if self.uses_rollups else Count('id')
+
+    def series(self) -> List[MetricBucket]:
+        """
+        Count the clicks per time bucket, including the buckets without clicks
+        :return: list of MetricBucket, oldest first
+        """
+        field = 'day' if self.uses_rollups else 'created_at'
+        counts = {}
+        rows = (self._queryset().annotate(bucket=_TRUNCATE[self.granularity](field))
+                .values('bucket').annotate(count=self._count()).order_by())
+        for row in rows:
+            bucket = row['bucket']
+            if isinstance(bucket, datetime.datetime):
+                bucket = _bucket_start(bucket, self.granularity)
+            counts[bucket] = counts.get(bucket, 0) + row['count']
+
+        buckets = []
+        bucket = _bucket_start(self.start, self.granularity)
+        last_bucket = _bucket_start(self.end - datetime.timedelta(microseconds=1), self.granularity)
+        while bucket <= last_bucket:
+            pk = '{}-{}'.format(self.url_id, bucket.isoformat())
+            buckets.append(MetricBucket(pk, bucket, counts.get(bucket, 0)))
+            bucket = _next_bucket(bucket, self.granularity)
+        return buckets
+
+    def user_agents(self, limit: int) -> List[dict]:
+        """
+        Count the clicks by browser and platform
+        :param limit: number of browser and platform pairs to keep, the rest is counted as other
+        :return: list of dicts with the browser, platform and count, most used first
+        """
+        return user_agent_breakdown(self._queryset(), limit, self._count())
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import datetime
+from collections import namedtuple
+from typing import Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+# A page of a keyset pagination, next_cursor is None on the last page
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor'])
+
+# Range of the primary keys, signed 64-bit integers
+_PK_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def encode_cursor(created_at: datetime.datetime, pk: int) -> str:
+    """
+    Encode the position of a row in the pagination
+    :param created_at: of the row
+    :param pk: of the row
+    :return: str: opaque cursor
+    """
+    return base64.urlsafe_b64encode('{}|{}'.format(created_at.isoformat(), pk).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Decode a cursor encoded with encode_cursor
+    :param cursor: to decode
+    :return: tuple with the created_at and pk of the row
+    :raise ValueError: if the cursor is not valid
+    """
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at, pk = datetime.datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('The cursor is not valid')
+
+    # A pk out of range would overflow the query
+    if pk not in _PK_RANGE:
+        raise ValueError('The cursor is not valid')
+    return created_at, pk
+
+
+def paginate_by_created_at(queryset: QuerySet, cursor: Optional[str], page_size: int) -> KeysetPage:
+    """
+    Get a page of rows, latest first, seeking past the cursor instead of counting an offset
+    :param queryset: rows with created_at and id columns
+    :param cursor: position of the last row of the previous page, None or not valid for the first page
+    :param page_size: number of rows by page
+    :return: KeysetPage
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        try:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        except ValueError:
+            pass
+
+    # Get one more row to know if there is a next page
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return KeysetPage(items, None)
+
+    items = items[:page_size]
+    return KeysetPage(items, encode_cursor(items[-1].created_at, items[-1].pk))
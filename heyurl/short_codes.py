@@ -0,0 +1,114 @@
+import string
+import threading
+from typing import Callable, List
+
+# Characters allowed in a short url
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+# Length of the allocated short urls
+CODE_LENGTH = 5
+
+# Number of distinct short urls of CODE_LENGTH characters
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+# Affine permutation of [0, CODE_SPACE) scrambling the sequence numbers, the
+# multiplier is coprime with CODE_SPACE so the permutation is bijective
+_MULTIPLIER = 387420489
+_INCREMENT = 104729
+_INVERSE_MULTIPLIER = pow(_MULTIPLIER, -1, CODE_SPACE)
+
+
+class ShortCodeSpaceExhausted(Exception):
+    """
+    Raised when every short url of CODE_LENGTH characters has been allocated
+    """
+
+
+def encode_short_code(number: int) -> str:
+    """
+    Encode a sequence number as a scrambled short url
+    :param number: sequence number in [0, CODE_SPACE)
+    :return: str: short url of CODE_LENGTH characters
+    """
+    if not 0 <= number < CODE_SPACE:
+        raise ShortCodeSpaceExhausted('The short url space is exhausted')
+
+    value = (number * _MULTIPLIER + _INCREMENT) % CODE_SPACE
+    characters = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, len(ALPHABET))
+        characters.append(ALPHABET[index])
+    return ''.join(reversed(characters))
+
+
+def is_short_code(short_code: str) -> bool:
+    """
+    Check if a short url may have been allocated
+    :param short_code: to check
+    :return: bool: if it has CODE_LENGTH characters of the ALPHABET
+    """
+    return len(short_code) == CODE_LENGTH and all(character in ALPHABET for character in short_code)
+
+
+def decode_short_code(short_code: str) -> int:
+    """
+    Decode a short url of CODE_LENGTH characters back to its sequence number
+    :param short_code: encoded with encode_short_code
+    :return: int: the sequence number
+    """
+    value = 0
+    for character in short_code:
+        value = value * len(ALPHABET) + ALPHABET.index(character)
+    return ((value - _INCREMENT) * _INVERSE_MULTIPLIER) % CODE_SPACE
+
+
+class ShortCodeAllocator:
+    """
+    Allocates unique short urls from blocks of sequence numbers.
+
+    Each process leases a block of BLOCK_SIZE sequence numbers at a time and hands
+    them out from memory, so allocating a short url costs one database query per
+    block instead of a read of every existing short url.
+    """
+
+    def __init__(self, lease: Callable[[int], range], block_size: int):
+        """
+        :param lease: reserves the given number of sequence numbers and returns their range
+        :param block_size: number of sequence numbers leased at a time
+        """
+        self.lease = lease
+        self.block_size = block_size
+        self._block = range(0)
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        """
+        Allocate a short url
+        :return: str: the new short url
+        """
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count: int) -> List[str]:
+        """
+        Allocate several short urls
+        :param count: number of short urls
+        :return: list of the new short urls
+        """
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if not self._block:
+                    self._block = self.lease(max(self.block_size, count - len(numbers)))
+
+                taken = self._block[:count - len(numbers)]
+                self._block = self._block[len(taken):]
+                numbers.extend(taken)
+
+        return [encode_short_code(number) for number in numbers]
+
+    def reset(self):
+        """
+        Forget the leased block
+        """
+        with self._lock:
+            self._block = range(0)
@@ -1,11 +1,55 @@
-from django.test import TestCase
+import json
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+from unittest import mock, skipIf
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-
-from heyurl.models import Url, Click
+from user_agents import parse as parse_user_agent
+
+from heyurl import views
+from heyurl.benchmark import run_scenario, scenarios, seed, warm_caches
+from heyurl.cache import BloomFilter, LRUCache, ShortCodeFilter, resolution_cache, user_agent_cache
+from heyurl.db import ReplicaRouter, apply_sqlite_pragmas, replica_reads
+from heyurl.instrumentation import Registry
+from heyurl.models import Browser, Url, Click, ClickRollup, Platform, ShortUrlSequence
+from heyurl.models.url import short_code_allocator, short_code_filter
+from heyurl.services import (ClickEvent, ClickMetrics, backfill_click_rollups, click_pipeline, increment_clicks,
+                             prune_clicks, shorten_urls, user_agent_breakdown)
+from heyurl.services.click_pipeline import ClickPipeline
+from heyurl.services.pagination import encode_cursor
+from heyurl.short_codes import (ALPHABET, CODE_LENGTH, CODE_SPACE, ShortCodeAllocator, decode_short_code,
+                                encode_short_code, is_short_code)
+from urls.asgi import application as asgi_application
+
+# Writes the clicks during the redirect request
+SYNCHRONOUS_CLICK_PIPELINE = {
+    'ASYNC': False,
+    'FLUSH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+}
 
 
 class IndexTests(TestCase):
+    def setUp(self):
+        # The resolution cache outlives the test transactions
+        resolution_cache.clear()
+
     def test_index_render_without_stored_urls(self):
         """
         Test that the index page renders without stored URLS
@@ -58,7 +102,7 @@ class IndexTests(TestCase):
 
     def test_store(self):
         """
-        Test that the store view will create a new URL
+        Test that the store view will create a new URL and redirect to the index page
         """
         # Assert that there are no URLs in the system
         self.assertFalse(Url.objects.exists())
@@ -68,8 +112,10 @@ class IndexTests(TestCase):
         response = self.client.post(reverse('store'), {
             'original_url': original_url,
         })
-        # Assert that the page was rendered successfully
-        self.assertEqual(response.status_code, 200)
+        # Assert that the user was redirected to the index page
+        self.assertRedirects(response, reverse('index'), status_code=303)
+        # Follow the redirect
+        response = self.client.get(response.url)
         # Assert that the table header is present
         self.assertContains(response, "Clicks Count")
         # Assert that the URL is in the table
@@ -77,6 +123,18 @@ class IndexTests(TestCase):
         # Assert that there is a new URL in the database
         self.assertEqual(Url.objects.count(), 1)
 
+    def test_store_does_not_list_urls(self):
+        """
+        Test that storing a URL does not query the URLs listing
+        """
+        with mock.patch('heyurl.views.paginate_by_created_at') as paginate:
+            response = self.client.post(reverse('store'), {
+                'original_url': "https://www.google.com",
+            })
+
+        self.assertEqual(response.status_code, 303)
+        paginate.assert_not_called()
+
     def test_store_missing_required_field(self):
         """
         Test that the store view returns an error when the original_url field is missing
@@ -143,6 +201,7 @@ class IndexTests(TestCase):
         # Assert that there is only one URL in the database
         self.assertEqual(Url.objects.count(), 1)
 
+    @override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
     def test_short_url_click(self):
         """
         Test that the short URL click view will increment the clicks count and create a new Click object
@@ -194,13 +253,30 @@ class IndexTests(TestCase):
         # Call the short URL click view
         response = self.client.get(reverse('short_url', kwargs={'short_url': short_url}))
 
-        # Assert that the page was rendered successfully
-        self.assertEqual(response.status_code, 200)
-
         # Assert that the 404 page was rendered
-        self.assertContains(response, "404")
-        self.assertContains(response, "Short URL not found!")
-        self.assertContains(response, "Go back to homepage")
+        self.assertContains(response, "404", status_code=404)
+        self.assertContains(response, "Short URL not found!", status_code=404)
+        self.assertContains(response, "Go back to homepage", status_code=404)
+
+    def test_short_url_not_found_is_pre_rendered(self):
+        """
+        Test that the 404 page of the unknown short urls is rendered once and is cacheable
+        """
+        with mock.patch('heyurl.views.render_to_string', return_value='404 Short URL not found!') as render_page:
+            views._not_found_content.cache_clear()
+            self.addCleanup(views._not_found_content.cache_clear)
+
+            for name in ('short_url', 'metric-panel', 'short_url'):
+                response = self.client.get(reverse(name, kwargs={'short_url': "R4nd0m"}))
+                self.assertContains(response, "Short URL not found!", status_code=404)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age={}'.format(settings.HEYURL_NOT_FOUND['MAX_AGE']), response['Cache-Control'])
+
+        # Assert that the page was rendered once
+        render_page.assert_called_once_with('heyurl/short_url_not_found_404.html')
+
+        response = self.client.get(reverse('click-export'), {'short_url': "R4nd0m"})
+        self.assertContains(response, "Short URL not found!", status_code=404)
 
     def test_metric_panel(self):
         """
@@ -231,22 +307,22 @@ class IndexTests(TestCase):
         # Create 3 Clicks objects
         Click.objects.create(
             url=url,
-            browser="Chrome",
-            platform="Windows",
+            browser_id=Browser.intern("Chrome"),
+            platform_id=Platform.intern("Windows"),
             created_at=dt_20,
             updated_at=dt_20,
         )
         Click.objects.create(
             url=url,
-            browser="Chrome",
-            platform="Windows",
+            browser_id=Browser.intern("Chrome"),
+            platform_id=Platform.intern("Windows"),
             created_at=dt_20,
             updated_at=dt_20,
         )
         Click.objects.create(
             url=url,
-            browser="Safari",
-            platform="Mac OS X",
+            browser_id=Browser.intern("Safari"),
+            platform_id=Platform.intern("Mac OS X"),
             created_at=dt_21,
             updated_at=dt_21,
         )
@@ -328,13 +404,10 @@ class IndexTests(TestCase):
         # Call the short URL click view
         response = self.client.get(reverse('metric-panel', kwargs={'short_url': short_url}))
 
-        # Assert that the page was rendered successfully
-        self.assertEqual(response.status_code, 200)
-
         # Assert that the 404 page was rendered
-        self.assertContains(response, "404")
-        self.assertContains(response, "Short URL not found!")
-        self.assertContains(response, "Go back to homepage")
+        self.assertContains(response, "404", status_code=404)
+        self.assertContains(response, "Short URL not found!", status_code=404)
+        self.assertContains(response, "Go back to homepage", status_code=404)
 
 
 class UrlsViewSetTests(TestCase):
@@ -354,7 +427,7 @@ class UrlsViewSetTests(TestCase):
             original_url=original_url_1,
             clicks=0
         )
-        original_url_2 = "https://www.google.com"
+        original_url_2 = "https://www.facebook.com"
         # Create a URL
         url = Url.objects.create(
             original_url=original_url_2,
@@ -364,8 +437,8 @@ class UrlsViewSetTests(TestCase):
 
         Click.objects.create(
             url=url,
-            browser="Safari",
-            platform="Mac OS X",
+            browser_id=Browser.intern("Safari"),
+            platform_id=Platform.intern("Mac OS X"),
             created_at=dt_now,
             updated_at=dt_now,
         )
@@ -389,11 +462,41 @@ class UrlsViewSetTests(TestCase):
         # Assert that the response data has 2 items
         self.assertEqual(len(response_data['data']), 2)
 
-        # Assert that the response data has the correct data
-        self.assertEqual(response_data['data'][0]['attributes']['original-url'], original_url_1)
+        # Assert that the response data has the correct data, latest first
+        self.assertEqual(response_data['data'][0]['attributes']['original-url'], original_url_2)
 
         # Assert that the response data has the correct data
-        self.assertEqual(response_data['data'][1]['attributes']['original-url'], original_url_2)
+        self.assertEqual(response_data['data'][1]['attributes']['original-url'], original_url_1)
+
+    @override_settings(HEYURL_URL_METRICS_LIMIT=2)
+    def test_list_query_count(self):
+        """
+        Test that the url list view runs a fixed number of queries and caps the related metrics
+        """
+        dt_now = timezone.now()
+        for index in range(3):
+            url = Url.objects.create(original_url="https://www.example{}.com".format(index))
+            for _ in range(index + 2):
+                Click.objects.create(url=url, browser_id=Browser.intern("Safari"),
+                                     platform_id=Platform.intern("Mac OS X"), created_at=dt_now, updated_at=dt_now)
+        Site.objects.clear_cache()
+
+        # The version of the listing, the site, the urls and their latest clicks
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('urls-list'))
+
+        response_data = response.json()
+        self.assertEqual(len(response_data['data']), 3)
+        for item in response_data['data']:
+            metrics = item['relationships']['metrics']['data']
+            self.assertEqual(len(metrics), 2)
+            self.assertEqual(metrics[0]['type'], "metrics")
+            self.assertTrue(item['attributes']['url'].startswith("http://example.com/"))
+
+        # Assert that the latest clicks are related, latest first
+        latest_clicks = Click.objects.filter(url=url).order_by('-id').values_list('id', flat=True)[:2]
+        self.assertEqual([int(metric['id']) for metric in response_data['data'][0]['relationships']['metrics']['data']],
+                         list(latest_clicks))
 
     def test_list_empty(self):
         """
@@ -418,3 +521,1667 @@ class UrlsViewSetTests(TestCase):
 
         # Assert that the response data has 0 items
         self.assertEqual(len(response_data['data']), 0)
+
+
+class ResolutionCacheTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        short_code_filter.rebuild()
+
+    def test_resolve_is_cached(self):
+        """
+        Test that resolving a short url twice only queries the database once
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        with self.assertNumQueries(1):
+            resolved = Url.resolve(url.short_url)
+        self.assertEqual(resolved.id, url.id)
+        self.assertEqual(resolved.original_url, url.original_url)
+
+        # Assert that the second resolution is answered from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(Url.resolve(url.short_url), resolved)
+
+    @override_settings(HEYURL_SHORT_CODE_FILTER={**settings.HEYURL_SHORT_CODE_FILTER, 'ENABLED': False})
+    def test_resolve_unknown_short_url_is_cached(self):
+        """
+        Test that unknown short urls are negatively cached
+        """
+        with self.assertNumQueries(1):
+            self.assertIsNone(Url.resolve("R4nd0m"))
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(Url.resolve("R4nd0m"))
+
+    def test_save_invalidates_resolution(self):
+        """
+        Test that updating a url forgets its cached resolution
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+        Url.resolve(url.short_url)
+
+        url.original_url = "https://www.facebook.com"
+        url.save()
+
+        self.assertEqual(Url.resolve(url.short_url).original_url, "https://www.facebook.com")
+
+    def test_delete_invalidates_resolution(self):
+        """
+        Test that deleting a url forgets its cached resolution
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+        Url.resolve(url.short_url)
+
+        url.delete()
+
+        self.assertIsNone(Url.resolve(url.short_url))
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entry is evicted when the cache is full
+        """
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Use 'a' so 'b' becomes the least recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_lru_ttl(self):
+        """
+        Test that the entries expire after their time to live
+        """
+        cache = LRUCache(max_size=2, ttl=10)
+        with mock.patch('heyurl.cache.lru_cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('heyurl.cache.lru_cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('heyurl.cache.lru_cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+
+@override_settings(HEYURL_CLICK_PIPELINE={'ASYNC': True, 'FLUSH_SIZE': 2, 'FLUSH_INTERVAL': 60})
+class ClickPipelineTests(TestCase):
+    def setUp(self):
+        self.pipeline = ClickPipeline()
+        # Keep the clicks queued, the tests flush them from the test thread
+        patcher = mock.patch.object(self.pipeline, '_start_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _event(self, url, browser="Chrome"):
+        return ClickEvent(url_id=url.id, browser=browser, platform="Windows", created_at=timezone.now())
+
+    def test_record_is_queued(self):
+        """
+        Test that recording a click does not write to the database
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        with self.assertNumQueries(0):
+            self.pipeline.record(self._event(url))
+
+        self.assertFalse(Click.objects.exists())
+
+    def test_flush_writes_in_batches(self):
+        """
+        Test that flushing bulk creates the clicks and aggregates the counter increments
+        """
+        url1 = Url.objects.create(original_url="https://www.google.com")
+        url2 = Url.objects.create(original_url="https://www.facebook.com")
+
+        for url in (url1, url1, url2):
+            self.pipeline.record(self._event(url))
+
+        # Assert that the 3 clicks are written in 2 batches
+        self.assertEqual(self.pipeline.flush(), 3)
+
+        url1.refresh_from_db()
+        url2.refresh_from_db()
+        self.assertEqual(url1.clicks, 2)
+        self.assertEqual(url2.clicks, 1)
+        self.assertEqual(Click.objects.filter(url=url1).count(), 2)
+        self.assertEqual(Click.objects.filter(url=url2).count(), 1)
+
+        # Assert that the queue is empty
+        self.assertEqual(self.pipeline.flush(), 0)
+
+    def test_stop_drains_the_queue(self):
+        """
+        Test that stopping the pipeline writes the queued clicks
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+        self.pipeline.record(self._event(url))
+
+        self.pipeline.stop()
+
+        self.assertEqual(Click.objects.filter(url=url).count(), 1)
+
+    @override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
+    def test_record_synchronously(self):
+        """
+        Test that the clicks are written right away when the pipeline is not asynchronous
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        self.pipeline.record(self._event(url))
+
+        url.refresh_from_db()
+        self.assertEqual(url.clicks, 1)
+        self.assertEqual(Click.objects.filter(url=url).count(), 1)
+
+    def test_failing_url_does_not_lose_the_batch(self):
+        """
+        Test that the clicks of a batch are written url by url when the batch cannot be written
+        """
+        url1 = Url.objects.create(original_url="https://www.google.com")
+        url2 = Url.objects.create(original_url="https://www.facebook.com")
+
+        def increment(counts):
+            if url2.id in counts:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return increment_clicks(counts)
+
+        for url in (url1, url1, url2):
+            self.pipeline.record(self._event(url))
+
+        with mock.patch('heyurl.services.click_pipeline.increment_clicks', side_effect=increment), \
+                self.assertLogs('heyurl.services.click_pipeline', 'ERROR'):
+            self.assertEqual(self.pipeline.flush(), 3)
+
+        # Assert that only the clicks of the failing url are lost
+        url1.refresh_from_db()
+        self.assertEqual(url1.clicks, 2)
+        self.assertEqual(Click.objects.filter(url=url1).count(), 2)
+        self.assertFalse(Click.objects.filter(url=url2).exists())
+
+
+class ClickPipelineWorkerTests(TransactionTestCase):
+    def setUp(self):
+        Browser.clear_cache()
+        Platform.clear_cache()
+        # The interned ids are flushed with the tables after the test
+        self.addCleanup(Browser.clear_cache)
+        self.addCleanup(Platform.clear_cache)
+
+    def test_deleted_url_clicks_are_dropped(self):
+        """
+        Test that the worker drops the queued clicks of a deleted url and writes the others
+        """
+        pipeline = ClickPipeline()
+        url = Url.objects.create(original_url="https://www.google.com")
+        deleted_url = Url.objects.create(original_url="https://www.facebook.com")
+
+        for clicked_url in (url, url, deleted_url):
+            pipeline.record(ClickEvent(url_id=clicked_url.id, browser="Chrome", platform="Windows",
+                                       created_at=timezone.now()))
+        deleted_url.delete()
+
+        pipeline.stop()
+
+        url.refresh_from_db()
+        self.assertEqual(url.clicks, 2)
+        self.assertEqual(Click.objects.filter(url=url).count(), 2)
+        self.assertEqual(Click.objects.count(), 2)
+
+
+class ClickCounterTests(TestCase):
+
+    def test_increment_clicks(self):
+        """
+        Test that the increments are applied by the database without touching updated_at
+        """
+        url1 = Url.objects.create(original_url="https://www.google.com", clicks=2)
+        url2 = Url.objects.create(original_url="https://www.facebook.com")
+        updated_at = url1.updated_at
+
+        # Assert that there is one update per url
+        with self.assertNumQueries(2):
+            increment_clicks({url1.id: 3, url2.id: 1})
+
+        url1.refresh_from_db()
+        url2.refresh_from_db()
+        self.assertEqual(url1.clicks, 5)
+        self.assertEqual(url2.clicks, 1)
+        self.assertEqual(url1.updated_at, updated_at)
+
+    def test_save_does_not_overwrite_clicks(self):
+        """
+        Test that saving a stale url does not lose the concurrent increments
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+        stale_url = Url.objects.get(pk=url.pk)
+
+        increment_clicks({url.id: 4})
+
+        # Save the url loaded before the increments
+        stale_url.original_url = "https://www.facebook.com"
+        stale_url.save()
+
+        url.refresh_from_db()
+        self.assertEqual(url.clicks, 4)
+        self.assertEqual(url.original_url, "https://www.facebook.com")
+
+
+class ShortCodeTests(TestCase):
+    def setUp(self):
+        # The leased block outlives the test transactions
+        short_code_allocator.reset()
+
+    def test_encode_is_bijective(self):
+        """
+        Test that the sequence numbers are encoded to distinct 5 characters short urls
+        """
+        numbers = list(range(1000)) + [CODE_SPACE - 1]
+        short_urls = [encode_short_code(number) for number in numbers]
+
+        self.assertEqual(len(set(short_urls)), len(numbers))
+        for number, short_url in zip(numbers, short_urls):
+            self.assertRegex(short_url, r'^[a-zA-Z0-9]{5}$')
+            self.assertEqual(decode_short_code(short_url), number)
+
+    def test_allocator_leases_blocks(self):
+        """
+        Test that the allocator only leases a new block when the current one is used up
+        """
+        leases = []
+
+        def lease(size):
+            leases.append(size)
+            return range(len(leases) * 10, len(leases) * 10 + size)
+
+        allocator = ShortCodeAllocator(lease, block_size=3)
+        short_urls = [allocator.allocate() for _ in range(4)] + allocator.allocate_many(5)
+
+        self.assertEqual(leases, [3, 3, 3])
+        self.assertEqual(len(set(short_urls)), 9)
+
+    def test_lease(self):
+        """
+        Test that the leased blocks of the sequence do not overlap
+        """
+        self.assertEqual(ShortUrlSequence.lease(10), range(0, 10))
+        self.assertEqual(ShortUrlSequence.lease(5), range(10, 15))
+
+    def test_create_does_not_load_the_short_urls(self):
+        """
+        Test that creating a url runs a fixed number of queries
+        """
+        for index in range(3):
+            Url.objects.create(original_url="https://www.example{}.com".format(index))
+
+        # Assert that only the insert and its savepoint run within a leased block
+        with self.assertNumQueries(3):
+            url = Url.objects.create(original_url="https://www.google.com")
+        self.assertEqual(len(url.short_url), 5)
+
+
+class UniqueUrlTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        short_code_allocator.reset()
+
+    def test_original_url_is_unique(self):
+        """
+        Test that the database rejects a duplicated original_url
+        """
+        Url.objects.create(original_url="https://www.google.com")
+
+        with self.assertRaises(IntegrityError):
+            Url.objects.create(original_url="https://www.google.com")
+
+        self.assertEqual(Url.objects.count(), 1)
+
+    def test_is_valid_url_does_not_query(self):
+        """
+        Test that the validation of the original_url leaves the uniqueness to the database
+        """
+        with self.assertNumQueries(0):
+            self.assertIsNone(Url.is_valid_url("https://www.google.com"))
+
+    def test_short_url_clash_is_skipped(self):
+        """
+        Test that a short_url clashing with a legacy one is skipped
+        """
+        dt_now = timezone.now()
+        # Store a legacy url with the first short_url the allocator will hand out
+        Url.objects.bulk_create([Url(
+            short_url=encode_short_code(0),
+            original_url="https://www.facebook.com",
+            created_at=dt_now,
+            updated_at=dt_now,
+        )])
+
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        self.assertEqual(url.short_url, encode_short_code(1))
+        self.assertEqual(Url.objects.count(), 2)
+
+
+class UniqueUrlMigrationTests(TransactionTestCase):
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('heyurl')
+        executor.migrate([('heyurl', '0002_short_url_sequence')])
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(self.latest))
+        # The tables of the families are created again
+        self.addCleanup(Browser.clear_cache)
+        self.addCleanup(Platform.clear_cache)
+        self.apps = executor.loader.project_state([('heyurl', '0002_short_url_sequence')]).apps
+
+    def test_duplicate_urls_are_merged(self):
+        """
+        Test that the urls stored before they were unique are merged or given a new short url
+        """
+        HistoricalUrl = self.apps.get_model('heyurl', 'Url')
+        HistoricalClick = self.apps.get_model('heyurl', 'Click')
+        now = timezone.now()
+
+        first, duplicate, other = [
+            HistoricalUrl.objects.create(original_url=original_url, short_url=short_url, clicks=clicks,
+                                         created_at=now, updated_at=now)
+            for original_url, short_url, clicks in [("https://www.google.com", "abc", 1),
+                                                    ("https://www.google.com", "def", 2),
+                                                    ("https://www.facebook.com", "abc", 0)]
+        ]
+        for url in (first, duplicate, duplicate):
+            HistoricalClick.objects.create(url=url, browser="Chrome", platform="Windows", created_at=now,
+                                           updated_at=now)
+
+        MigrationExecutor(connection).migrate([('heyurl', '0003_unique_short_and_original_url')])
+
+        # Assert that the duplicate was merged into the first url and the other url got a new short url
+        HistoricalUrl = MigrationExecutor(connection).loader.project_state(
+            [('heyurl', '0003_unique_short_and_original_url')]
+        ).apps.get_model('heyurl', 'Url')
+        urls = {url.id: url for url in HistoricalUrl.objects.all()}
+        self.assertEqual(set(urls), {first.id, other.id})
+        self.assertEqual(urls[first.id].clicks, 3)
+        self.assertEqual(urls[first.id].short_url, "abc")
+        self.assertEqual(len(urls[other.id].short_url), 6)
+        self.assertEqual(HistoricalClick.objects.filter(url_id=first.id).count(), 3)
+
+
+class ClickRollupTests(TestCase):
+    def setUp(self):
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+    def _create_click(self, created_at, browser="Chrome", platform="Windows"):
+        return Click.objects.create(
+            url=self.url,
+            browser_id=Browser.intern(browser),
+            platform_id=Platform.intern(platform),
+            created_at=created_at,
+            updated_at=created_at,
+        )
+
+    def _rollups(self):
+        return list(ClickRollup.objects.order_by('day', 'browser__name')
+                    .values_list('day', 'browser__name', 'platform__name', 'count'))
+
+    def test_create_click_increments_rollup(self):
+        """
+        Test that creating clicks maintains their rollups
+        """
+        dt_now = timezone.now()
+        dt_yesterday = dt_now - timezone.timedelta(days=1)
+
+        self._create_click(dt_now)
+        self._create_click(dt_now)
+        self._create_click(dt_now, browser="Safari", platform="Mac OS X")
+        self._create_click(dt_yesterday)
+
+        self.assertEqual(self._rollups(), [
+            (dt_yesterday.date(), "Chrome", "Windows", 1),
+            (dt_now.date(), "Chrome", "Windows", 2),
+            (dt_now.date(), "Safari", "Mac OS X", 1),
+        ])
+
+    @override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
+    def test_pipeline_increments_rollup(self):
+        """
+        Test that the clicks written by the click pipeline are counted in their rollups
+        """
+        dt_now = timezone.now()
+        pipeline = ClickPipeline()
+        for _ in range(2):
+            pipeline.record(ClickEvent(url_id=self.url.id, browser="Chrome", platform="Windows", created_at=dt_now))
+
+        self.assertEqual(self._rollups(), [(dt_now.date(), "Chrome", "Windows", 2)])
+
+    def test_backfill_click_rollups(self):
+        """
+        Test that the backfill command rebuilds the rollups from the raw clicks
+        """
+        dt_now = timezone.now()
+        dt_last_week = dt_now - timezone.timedelta(days=7)
+        self._create_click(dt_now)
+        self._create_click(dt_now)
+        self._create_click(dt_last_week)
+        expected_rollups = self._rollups()
+
+        # Rebuild every rollup
+        ClickRollup.objects.all().delete()
+        call_command('backfill_click_rollups', stdout=mock.Mock())
+        self.assertEqual(self._rollups(), expected_rollups)
+
+        # Rebuild the rollups since yesterday, leaving last week untouched
+        ClickRollup.objects.filter(day=dt_now.date()).update(count=10)
+        since = (dt_now - timezone.timedelta(days=1)).date().isoformat()
+        call_command('backfill_click_rollups', since=since, stdout=mock.Mock())
+        self.assertEqual(self._rollups(), expected_rollups)
+
+    def test_metric_panel_reads_rollups(self):
+        """
+        Test that the metric panel runs the same queries regardless of the number of clicks
+        """
+        resolution_cache.clear()
+        dt_now = timezone.now()
+        for _ in range(20):
+            self._create_click(dt_now)
+
+        # Resolve the short url, get its version, the clicks per day and the user agents
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}))
+        self.assertContains(response, "<td>20</td>", html=True)
+
+
+class UserAgentBreakdownTests(TestCase):
+    def setUp(self):
+        self.url = Url.objects.create(original_url="https://www.google.com")
+        day = timezone.now().date()
+        for browser, platform, count in [("Chrome", "Windows", 5), ("Safari", "Mac OS X", 3),
+                                         ("Firefox", "Linux", 2), ("Edge", "Windows", 1)]:
+            ClickRollup.objects.create(url=self.url, day=day, browser_id=Browser.intern(browser),
+                                       platform_id=Platform.intern(platform), count=count)
+
+    def test_breakdown_buckets_other(self):
+        """
+        Test that the user agents past the top ones are counted as other
+        """
+        breakdown = user_agent_breakdown(ClickRollup.objects.filter(url=self.url), 2)
+
+        self.assertEqual(breakdown, [
+            {'browser': "Chrome", 'platform': "Windows", 'count': 5},
+            {'browser': "Safari", 'platform': "Mac OS X", 'count': 3},
+            {'browser': "Other", 'platform': "Other", 'count': 3},
+        ])
+
+    def test_breakdown_without_other(self):
+        """
+        Test that there is no other bucket when every user agent is listed
+        """
+        breakdown = user_agent_breakdown(ClickRollup.objects.filter(url=self.url), 10)
+
+        self.assertEqual([item['browser'] for item in breakdown], ["Chrome", "Safari", "Firefox", "Edge"])
+
+    @override_settings(HEYURL_METRICS_TOP_USER_AGENTS=1)
+    def test_metric_panel_renders_breakdown(self):
+        """
+        Test that the metric panel renders the counts of the top user agents and of the other ones
+        """
+        resolution_cache.clear()
+
+        response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}))
+
+        self.assertContains(response, "<tr><td>Chrome</td><td>Windows</td><td>5</td></tr>", html=True)
+        self.assertContains(response, "<tr><td>Other</td><td>Other</td><td>6</td></tr>", html=True)
+        self.assertNotContains(response, "Safari")
+
+
+CHROME_ON_WINDOWS = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                     "Chrome/111.0.0.0 Safari/537.36")
+
+
+class UserAgentCacheTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        user_agent_cache.clear()
+
+    def test_classify_is_memoized(self):
+        """
+        Test that a user agent is only parsed once
+        """
+        with mock.patch('heyurl.cache.user_agents.parse', wraps=parse_user_agent) as parse:
+            families = user_agent_cache.classify(CHROME_ON_WINDOWS)
+            self.assertEqual(user_agent_cache.classify(CHROME_ON_WINDOWS), families)
+
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual((families.browser, families.platform), ("Chrome", "Windows"))
+        stats = user_agent_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size'], stats['parses']), (1, 1, 1, 1))
+        self.assertGreater(stats['parse_seconds'], 0)
+
+    @override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
+    def test_short_url_click_records_user_agent(self):
+        """
+        Test that the short URL click view records the browser and platform of the user agent
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        self.client.get(reverse('short_url', kwargs={'short_url': url.short_url}),
+                        HTTP_USER_AGENT=CHROME_ON_WINDOWS)
+
+        click = Click.objects.get(url=url)
+        self.assertEqual((click.browser.name, click.platform.name), ("Chrome", "Windows"))
+
+
+@override_settings(HEYURL_INDEX_PAGE_SIZE=2)
+class IndexPaginationTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        dt_now = timezone.now()
+        # Create 5 urls, two of them created at the same time
+        self.urls = []
+        for index, minutes in enumerate([5, 4, 3, 3, 1]):
+            url = Url.objects.create(original_url="https://www.example{}.com".format(index))
+            Url.objects.filter(pk=url.pk).update(created_at=dt_now - timezone.timedelta(minutes=minutes))
+            self.urls.append(url)
+
+    def test_index_pages(self):
+        """
+        Test that following the cursors lists every url once, latest first
+        """
+        listed = []
+        path = reverse('index')
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.context['urls']), 2)
+            listed.extend(url.pk for url in response.context['urls'])
+
+            next_cursor = response.context['next_cursor']
+            path = '{}?cursor={}'.format(reverse('index'), next_cursor) if next_cursor else None
+
+        self.assertEqual(listed, [self.urls[4].pk, self.urls[3].pk, self.urls[2].pk, self.urls[1].pk,
+                                  self.urls[0].pk])
+
+    def test_index_query_count(self):
+        """
+        Test that a page of the index only runs one query
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, "Older")
+        self.assertNotContains(response, "Latest")
+
+    def test_index_invalid_cursor(self):
+        """
+        Test that an invalid cursor renders the first page
+        """
+        overflowing_cursor = encode_cursor(self.urls[3].created_at, 10 ** 30)
+        for cursor in ('not-a-cursor', overflowing_cursor):
+            response = self.client.get(reverse('index'), {'cursor': cursor})
+
+            self.assertEqual([url.pk for url in response.context['urls']], [self.urls[4].pk, self.urls[3].pk])
+
+
+class BulkShortenTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        short_code_allocator.reset()
+
+    def _post(self, original_urls, resource_type="urls"):
+        payload = {'data': [{'type': resource_type, 'attributes': {'original-url': original_url}}
+                            for original_url in original_urls]}
+        return self.client.post(reverse('urls-bulk'), data=json.dumps(payload),
+                                content_type='application/vnd.api+json')
+
+    def test_bulk(self):
+        """
+        Test that the bulk endpoint creates the new urls and reports the result of every item
+        """
+        url = Url.objects.create(original_url="https://www.google.com")
+
+        response = self._post(["https://www.facebook.com", "https://www.google.com", "not a url",
+                               "https://www.facebook.com"])
+
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        created_url = Url.objects.get(original_url="https://www.facebook.com")
+        self.assertEqual(response_data['meta']['results'], [
+            {'status': "created", 'id': str(created_url.pk)},
+            {'status': "existing", 'id': str(url.pk)},
+            {'status': "invalid", 'detail': "The Original URL is not valid!"},
+            {'status': "created", 'id': str(created_url.pk)},
+        ])
+        self.assertEqual([item['id'] for item in response_data['data']], [str(created_url.pk), str(url.pk)])
+        self.assertEqual(len(created_url.short_url), 5)
+        self.assertEqual(Url.objects.count(), 2)
+
+        # Assert that the new url can be resolved right away
+        self.assertEqual(Url.resolve(created_url.short_url).original_url, "https://www.facebook.com")
+
+    def test_bulk_query_count(self):
+        """
+        Test that the number of queries does not depend on the number of urls
+        """
+        # Lease a block of short urls big enough for both requests
+        short_code_allocator.allocate()
+
+        query_counts = []
+        for count in (5, 50):
+            original_urls = ["https://www.example{}-{}.com".format(count, index) for index in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post(original_urls)
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(Url.objects.count(), 55)
+
+    def test_bulk_wrong_type(self):
+        """
+        Test that the bulk endpoint rejects resource objects of another type
+        """
+        response = self._post(["https://www.google.com"], resource_type="metrics")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Url.objects.exists())
+
+    @override_settings(HEYURL_BULK_SHORTEN_MAX_ITEMS=2)
+    def test_bulk_too_many_urls(self):
+        """
+        Test that the bulk endpoint rejects too many urls
+        """
+        response = self._post(["https://www.example{}.com".format(index) for index in range(3)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Url.objects.exists())
+
+
+class ClickExportTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        self.dt_now = timezone.now()
+        self.url1 = Url.objects.create(original_url="https://www.google.com")
+        self.url2 = Url.objects.create(original_url="https://www.facebook.com")
+        for url, created_at in [(self.url1, self.dt_now - timezone.timedelta(days=10)),
+                                (self.url1, self.dt_now), (self.url2, self.dt_now)]:
+            Click.objects.create(url=url, browser_id=Browser.intern("Chrome"), platform_id=Platform.intern("Windows"),
+                                 created_at=created_at, updated_at=created_at)
+
+    def test_export_ndjson(self):
+        """
+        Test that the clicks of a short url are streamed as NDJSON
+        """
+        response = self.client.get(reverse('click-export'), {'short_url': self.url1.short_url})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], "application/x-ndjson")
+        clicks = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(clicks), 2)
+        self.assertEqual(clicks[1]['short_url'], self.url1.short_url)
+        self.assertEqual(clicks[1]['browser'], "Chrome")
+        self.assertEqual(clicks[1]['created_at'], self.dt_now.isoformat())
+
+    def test_export_csv_time_range(self):
+        """
+        Test that the clicks created in a time range are streamed as CSV
+        """
+        start = (self.dt_now - timezone.timedelta(days=1)).date().isoformat()
+
+        response = self.client.get(reverse('click-export'), {'format': "csv", 'from': start})
+
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,short_url,browser,platform,created_at")
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], [self.url1.short_url, self.url2.short_url])
+
+    def test_export_invalid_parameters(self):
+        """
+        Test that the export rejects an unknown format or an invalid date
+        """
+        self.assertEqual(self.client.get(reverse('click-export'), {'format': "xml"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('click-export'), {'from': "yesterday"}).status_code, 400)
+
+
+class AsgiClickExportTests(TransactionTestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        # The tables are emptied between the tests, forget the ids of the families they held
+        for family in (Browser, Platform):
+            family.clear_cache()
+            self.addCleanup(family.clear_cache)
+        self.url = Url.objects.create(original_url="https://www.google.com")
+        now = timezone.now()
+        for _ in range(3):
+            Click.objects.create(url=self.url, browser_id=Browser.intern("Chrome"),
+                                 platform_id=Platform.intern("Windows"), created_at=now, updated_at=now)
+
+    async def _asgi_get(self, path, query_string=b''):
+        # Send the request through the ASGI application, which iterates the response on the event loop
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'asgi': {'version': '3'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'query_string': query_string, 'headers': [(b'host', b'testserver')],
+        })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(5)
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        return start['status'], body
+
+    def test_export_csv(self):
+        """
+        Test that the clicks are exported as CSV through the ASGI application
+        """
+        status, body = async_to_sync(self._asgi_get)(reverse('click-export'), b'format=csv')
+
+        self.assertEqual(status, 200)
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], "id,short_url,browser,platform,created_at")
+        self.assertEqual(len(lines), 4)
+
+    @override_settings(HEYURL_CLICK_EXPORT_ASGI_MAX_ROWS=2)
+    def test_export_too_many_clicks(self):
+        """
+        Test that the ASGI application rejects an export of more clicks than it reads in memory
+        """
+        status, _ = async_to_sync(self._asgi_get)(reverse('click-export'), b'format=ndjson')
+
+        self.assertEqual(status, 400)
+
+
+class ClickMetricsTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+        for day, hour in [(3, 10), (3, 10), (3, 15), (5, 9), (12, 23)]:
+            created_at = timezone.make_aware(datetime.datetime(2026, 10, day, hour, 30))
+            Click.objects.create(url=self.url, browser_id=Browser.intern("Chrome"),
+                                 platform_id=Platform.intern("Windows"), created_at=created_at, updated_at=created_at)
+
+    def _metrics(self, start, end, granularity):
+        return ClickMetrics(self.url.id, timezone.make_aware(start), timezone.make_aware(end), granularity)
+
+    def test_series_per_day_from_rollups(self):
+        """
+        Test that the clicks per day are answered from the rollups, including the days without clicks
+        """
+        metrics = self._metrics(datetime.datetime(2026, 10, 2), datetime.datetime(2026, 10, 6), 'day')
+
+        with self.assertNumQueries(1):
+            series = metrics.series()
+
+        self.assertEqual(metrics.source, "rollups")
+        self.assertEqual([(bucket.date, bucket.count) for bucket in series], [
+            (datetime.date(2026, 10, 2), 0),
+            (datetime.date(2026, 10, 3), 3),
+            (datetime.date(2026, 10, 4), 0),
+            (datetime.date(2026, 10, 5), 1),
+        ])
+
+    def test_series_per_week_and_month(self):
+        """
+        Test that the clicks are bucketed per week, starting on monday, and per month
+        """
+        weeks = self._metrics(datetime.datetime(2026, 10, 1), datetime.datetime(2026, 10, 15), 'week').series()
+        self.assertEqual([(bucket.date, bucket.count) for bucket in weeks], [
+            (datetime.date(2026, 9, 28), 3),
+            (datetime.date(2026, 10, 5), 1),
+            (datetime.date(2026, 10, 12), 1),
+        ])
+
+        months = self._metrics(datetime.datetime(2026, 9, 1), datetime.datetime(2027, 1, 1), 'month').series()
+        self.assertEqual([(bucket.date, bucket.count) for bucket in months], [
+            (datetime.date(2026, 9, 1), 0),
+            (datetime.date(2026, 10, 1), 5),
+            (datetime.date(2026, 11, 1), 0),
+            (datetime.date(2026, 12, 1), 0),
+        ])
+
+    def test_series_per_hour_from_clicks(self):
+        """
+        Test that the clicks per hour are answered from the raw clicks
+        """
+        metrics = self._metrics(datetime.datetime(2026, 10, 3, 9), datetime.datetime(2026, 10, 3, 12), 'hour')
+
+        self.assertEqual(metrics.source, "clicks")
+        self.assertEqual([bucket.count for bucket in metrics.series()], [0, 2, 0])
+
+    def test_invalid_metrics(self):
+        """
+        Test that an unknown granularity or an empty time range are rejected
+        """
+        with self.assertRaises(ValueError):
+            self._metrics(datetime.datetime(2026, 10, 1), datetime.datetime(2026, 10, 2), 'year')
+        with self.assertRaises(ValueError):
+            self._metrics(datetime.datetime(2026, 10, 2), datetime.datetime(2026, 10, 1), 'day')
+
+    @override_settings(HEYURL_METRICS_MAX_BUCKETS=24)
+    def test_too_many_buckets(self):
+        """
+        Test that a time range with more buckets than HEYURL_METRICS_MAX_BUCKETS is rejected
+        """
+        metrics = self._metrics(datetime.datetime(2026, 10, 3), datetime.datetime(2026, 10, 4), 'hour')
+        self.assertEqual(metrics.bucket_count, 24)
+        self.assertEqual(len(metrics.series()), 24)
+        self.assertEqual(self._metrics(datetime.datetime(2000, 1, 1), datetime.datetime(2001, 1, 1), 'month')
+                         .bucket_count, 12)
+
+        with self.assertRaises(ValueError):
+            self._metrics(datetime.datetime(2026, 10, 3), datetime.datetime(2026, 10, 4, 1), 'hour')
+
+        # Assert that both views answer a 400 without filling the buckets
+        with mock.patch.object(ClickMetrics, 'series') as series:
+            response = self.client.get(reverse('urls-metrics', kwargs={'pk': self.url.pk}),
+                                       {'from': "2000-01-01", 'to': "2026-01-01", 'granularity': "hour"})
+            self.assertEqual(response.status_code, 400)
+
+            response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}),
+                                       {'from': "2000-01-01", 'to': "2026-01-01", 'granularity': "hour"})
+            self.assertEqual(response.status_code, 400)
+        series.assert_not_called()
+
+    def test_metric_panel_in_december(self):
+        """
+        Test that the metric panel renders the current month in December
+        """
+        dt_december = timezone.make_aware(datetime.datetime(2026, 12, 15, 12))
+        with mock.patch('django.utils.timezone.now', return_value=dt_december):
+            response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['clicks']), 31)
+        self.assertContains(response, "Total clicks per day during this December")
+
+    def test_metric_panel_time_range(self):
+        """
+        Test that the metric panel renders the requested time range and granularity
+        """
+        response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}),
+                                   {'from': "2026-10-01", 'to': "2026-11-01", 'granularity': "week"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Total clicks per week during October 01, 2026 - October 31, 2026")
+        self.assertContains(response, "<tr><td>September 28, 2026</td><td>3</td></tr>", html=True)
+
+        response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}),
+                                   {'granularity': "year"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_metrics_resource(self):
+        """
+        Test that the metrics of a url are exposed as JSON:API metrics resources
+        """
+        response = self.client.get(reverse('urls-metrics', kwargs={'pk': self.url.pk}),
+                                   {'from': "2026-10-03", 'to': "2026-10-05"})
+
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data['data'], [
+            {'type': "metrics", 'id': "{}-2026-10-03".format(self.url.pk),
+             'attributes': {'date': "2026-10-03", 'count': 3}},
+            {'type': "metrics", 'id': "{}-2026-10-04".format(self.url.pk),
+             'attributes': {'date': "2026-10-04", 'count': 0}},
+        ])
+        self.assertEqual(response_data['meta']['granularity'], "day")
+        self.assertEqual(response_data['meta']['source'], "rollups")
+
+        # Assert that an invalid granularity is rejected
+        response = self.client.get(reverse('urls-metrics', kwargs={'pk': self.url.pk}), {'granularity': "year"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_metrics_of_an_invalid_url(self):
+        """
+        Test that the metrics of an invalid url id are not found
+        """
+        for pk in ("abc", "9" * 30):
+            response = self.client.get(reverse('urls-metrics', kwargs={'pk': pk}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_metrics_out_of_range(self):
+        """
+        Test that the time ranges in the first or last year datetime supports are rejected
+        """
+        for parameters in ({'from': "9999-12-31", 'to': "9999-12-31T23:59:59"}, {'from': "0001-01-01"}):
+            response = self.client.get(reverse('urls-metrics', kwargs={'pk': self.url.pk}), parameters)
+            self.assertEqual(response.status_code, 400)
+
+            response = self.client.get(reverse('metric-panel', kwargs={'short_url': self.url.short_url}), parameters)
+            self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        caches['default'].clear()
+        Site.objects.clear_cache()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+    def _assert_revalidated(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("must-revalidate", response['Cache-Control'])
+
+        etag = response['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b"")
+
+        # Assert that a new click changes the version of the response
+        now = timezone.now()
+        Click.objects.create(url=self.url, browser_id=Browser.intern("Chrome"), platform_id=Platform.intern("Windows"),
+                             created_at=now, updated_at=now)
+        increment_clicks({self.url.id: 1})
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_index_is_revalidated(self):
+        """
+        Test that the index answers a 304 until its urls change
+        """
+        self._assert_revalidated(reverse('index'))
+        self.assertIn("private", self.client.get(reverse('index'))['Cache-Control'])
+
+        response = self.client.get(reverse('index'))
+        etag = response['ETag']
+        Url.objects.create(original_url="https://www.facebook.com")
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "https://www.facebook.com")
+
+    def test_metric_panel_is_revalidated(self):
+        """
+        Test that the metric panel answers a 304 until the clicks of its url change
+        """
+        self._assert_revalidated(reverse('metric-panel', kwargs={'short_url': self.url.short_url}))
+
+    def test_urls_are_revalidated(self):
+        """
+        Test that the urls endpoint answers a 304 until the urls or their clicks change
+        """
+        self._assert_revalidated(reverse('urls-list'))
+
+    def test_metric_panel_is_cached(self):
+        """
+        Test that a rendered metric panel is served from the cache until its url changes
+        """
+        path = reverse('metric-panel', kwargs={'short_url': self.url.short_url})
+        response = self.client.get(path)
+
+        # Only get the version of the url, its resolution being cached too
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(path)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+
+    def test_metric_panel_period_is_cached_apart(self):
+        """
+        Test that the current month requested as a time range is not served the panel of this month
+        """
+        path = reverse('metric-panel', kwargs={'short_url': self.url.short_url})
+        response = self.client.get(path)
+
+        first_day = timezone.localdate().replace(day=1)
+        next_month_first_day = (first_day + datetime.timedelta(days=32)).replace(day=1)
+        time_range_response = self.client.get(path, {'from': first_day.isoformat(),
+                                                     'to': next_month_first_day.isoformat()})
+
+        self.assertNotEqual(time_range_response['ETag'], response['ETag'])
+        self.assertContains(time_range_response, "during {} - {}".format(
+            first_day.strftime('%B %d, %Y'), (next_month_first_day - datetime.timedelta(days=1)).strftime('%B %d, %Y')
+        ))
+
+
+@override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
+class RedirectStatusTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+    def _click(self):
+        return self.client.get(reverse('short_url', kwargs={'short_url': self.url.short_url}))
+
+    def test_default_redirect_is_not_cached(self):
+        """
+        Test that the short urls redirect temporarily by default, so every click is tracked
+        """
+        response = self._click()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, self.url.original_url)
+        self.assertIn("no-store", response['Cache-Control'])
+
+    @override_settings(HEYURL_REDIRECT={'STATUS': 301, 'MAX_AGE': 600})
+    def test_default_permanent_redirect_is_cacheable(self):
+        """
+        Test that a permanent default redirect can be kept by the browsers and edge caches
+        """
+        response = self._click()
+
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.url, self.url.original_url)
+        self.assertIn("public", response['Cache-Control'])
+        self.assertIn("max-age=600", response['Cache-Control'])
+
+    def test_url_redirect_status(self):
+        """
+        Test that the redirect status of a url overrides the default one, including a cached resolution
+        """
+        self.assertEqual(self._click().status_code, 302)
+
+        self.url.redirect_status = 308
+        self.url.save()
+        response = self._click()
+        self.assertEqual(response.status_code, 308)
+        self.assertIn("max-age=3600", response['Cache-Control'])
+
+        self.url.redirect_status = 307
+        self.url.save()
+        response = self._click()
+        self.assertEqual(response.status_code, 307)
+        self.assertIn("no-store", response['Cache-Control'])
+        self.assertEqual(Click.objects.filter(url=self.url).count(), 3)
+
+
+class AsyncRedirectTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+        short_code_filter.rebuild()
+
+    def test_asgi_application(self):
+        """
+        Test that the project exposes an ASGI application
+        """
+        from urls.asgi import application
+
+        self.assertTrue(callable(application))
+
+    def test_cached_redirect_does_not_query(self):
+        """
+        Test that a redirect of a cached short url only enqueues its click
+        """
+        with mock.patch.object(click_pipeline, 'record') as record:
+            # Resolve the short url from the database
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('short_url', kwargs={'short_url': self.url.short_url}))
+            self.assertEqual(response.status_code, 302)
+
+            # Assert that the resolution is answered from the cache
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('short_url', kwargs={'short_url': self.url.short_url}))
+            self.assertEqual(response.url, self.url.original_url)
+
+        self.assertEqual(record.call_count, 2)
+        self.assertEqual(record.call_args[0][0].url_id, self.url.id)
+
+
+class SQLiteTuningTests(TestCase):
+    def test_connection_pragmas(self):
+        """
+        Test that the new connections are tuned with the HEYURL_SQLITE_PRAGMAS setting
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            levels = {'off': 0, 'normal': 1, 'full': 2, 'extra': 3}
+            self.assertEqual(cursor.fetchone()[0], levels[settings.HEYURL_SQLITE_PRAGMAS['synchronous'].lower()])
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.HEYURL_SQLITE_PRAGMAS['busy_timeout'])
+
+    @skipIf(os.environ.get('HEYURL_SQLITE_JOURNAL_MODE'), 'the journal mode is configured')
+    def test_journal_mode_is_not_changed_by_default(self):
+        """
+        Test that the journal mode, stored in the database file, is only changed when it is configured
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            apply_sqlite_pragmas(db.cursor(), settings.HEYURL_SQLITE_PRAGMAS)
+            self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+            db.close()
+
+    def test_concurrent_writers(self):
+        """
+        Test that concurrent writers wait for each other instead of raising "database is locked"
+        """
+        writers, writes = 8, 25
+        pragmas = dict(settings.HEYURL_SQLITE_PRAGMAS, journal_mode='wal')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            with sqlite3.connect(path) as db:
+                apply_sqlite_pragmas(db.cursor(), pragmas)
+                db.execute('CREATE TABLE click (id INTEGER PRIMARY KEY, writer INTEGER)')
+
+            # Hold a read transaction open, it would block the writers without the WAL journal
+            reader = sqlite3.connect(path, isolation_level=None)
+            reader.execute('BEGIN')
+            reader.execute('SELECT COUNT(*) FROM click').fetchone()
+
+            errors = []
+
+            def write(writer):
+                # Only the busy_timeout pragma makes the connection wait for the lock
+                db = sqlite3.connect(path, timeout=0)
+                apply_sqlite_pragmas(db.cursor(), pragmas)
+                try:
+                    for _ in range(writes):
+                        with db:
+                            db.execute('INSERT INTO click (writer) VALUES (?)', (writer,))
+                except sqlite3.OperationalError as error:
+                    errors.append(error)
+                finally:
+                    db.close()
+
+            threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            reader.execute('COMMIT')
+            count = reader.execute('SELECT COUNT(*) FROM click').fetchone()[0]
+            reader.close()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(count, writers * writes)
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        caches['default'].clear()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+        # Record the reads routed to the replica, which is not configured in the tests
+        self.replica_reads = 0
+        patcher = mock.patch('heyurl.db.routers._replica_alias', side_effect=self._replica_alias)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _replica_alias(self):
+        self.replica_reads += 1
+
+    def test_routing(self):
+        """
+        Test that only the reads of a replica_reads block are routed to the replica
+        """
+        router = ReplicaRouter()
+        with mock.patch('heyurl.db.routers._replica_alias', return_value="replica"):
+            self.assertIsNone(router.db_for_read(Url))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Url), "replica")
+                self.assertEqual(router.db_for_write(Url), "default")
+            self.assertIsNone(router.db_for_read(Url))
+
+    def test_listing_and_metric_reads(self):
+        """
+        Test that the listing and metric views read from the replica
+        """
+        for path in [reverse('index'), reverse('urls-list'),
+                     reverse('metric-panel', kwargs={'short_url': self.url.short_url}),
+                     reverse('urls-metrics', kwargs={'pk': self.url.pk})]:
+            self.replica_reads = 0
+            self.assertEqual(self.client.get(path).status_code, 200)
+            self.assertGreater(self.replica_reads, 0, path)
+
+    def test_streamed_export_reads(self):
+        """
+        Test that the clicks export reads from the replica while it is streamed
+        """
+        response = self.client.get(reverse('click-export'), {'short_url': self.url.short_url})
+        self.replica_reads = 0
+        b"".join(response.streaming_content)
+        self.assertGreater(self.replica_reads, 0)
+
+    def test_resolution_reads_from_primary(self):
+        """
+        Test that the short urls are resolved from the primary, even within a replica_reads block
+        """
+        with mock.patch('heyurl.db.routers._replica_alias', return_value="replica"), replica_reads():
+            self.assertEqual(Url.resolve(self.url.short_url).id, self.url.id)
+
+    def test_store_sticks_to_primary(self):
+        """
+        Test that the client reads its writes from the primary after a store
+        """
+        with mock.patch('heyurl.db.routers._replica_alias', return_value="replica"):
+            response = self.client.post(reverse('store'), {'original_url': "https://www.facebook.com"})
+        self.assertIn(settings.HEYURL_REPLICA['STICKY_COOKIE'], response.cookies)
+
+        self.replica_reads = 0
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "https://www.facebook.com")
+        self.assertEqual(self.replica_reads, 0)
+
+
+class ReplicaDatabaseTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Add a replica in a database file of its own, once the test has opened the default database
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases['replica'] = {**connections.databases['default'],
+                                            'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+                                            'TEST': {}}
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        resolution_cache.clear()
+        now = timezone.now()
+        # The urls only stored by one of the databases tell which one a read landed on
+        Url.objects.using('default').bulk_create([Url(original_url="https://www.primary.com", short_url="prima",
+                                                      created_at=now, updated_at=now)])
+        Url.objects.using('replica').bulk_create([Url(original_url="https://www.replica.com", short_url="repli",
+                                                      created_at=now, updated_at=now)])
+        # The replica is not rolled back with the test
+        self.addCleanup(lambda: Url.objects.using('replica').all().delete())
+
+    def test_reads_land_on_the_replica(self):
+        """
+        Test that the listing reads from the replica database
+        """
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "https://www.replica.com")
+        self.assertNotContains(response, "https://www.primary.com")
+
+        response = self.client.get(reverse('urls-list'), HTTP_ACCEPT='application/vnd.api+json')
+        self.assertEqual([url['attributes']['original-url'] for url in response.json()['data']],
+                         ["https://www.replica.com"])
+
+    def test_writes_and_sticky_reads_land_on_the_primary(self):
+        """
+        Test that a store writes to the primary and that the client then reads from the primary
+        """
+        response = self.client.post(reverse('store'), {'original_url': "https://www.facebook.com"})
+        self.assertIn(settings.HEYURL_REPLICA['STICKY_COOKIE'], response.cookies)
+        self.assertTrue(Url.objects.using('default').filter(original_url="https://www.facebook.com").exists())
+        self.assertFalse(Url.objects.using('replica').filter(original_url="https://www.facebook.com").exists())
+
+        # Assert that the client reads its write from the primary within the sticky window
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "https://www.facebook.com")
+        self.assertContains(response, "https://www.primary.com")
+        self.assertNotContains(response, "https://www.replica.com")
+
+        # Assert that the client reads from the replica again once the sticky window is over
+        self.client.cookies.pop(settings.HEYURL_REPLICA['STICKY_COOKIE'])
+        self.assertContains(self.client.get(reverse('index')), "https://www.replica.com")
+
+
+@override_settings(HEYURL_CLICK_RETENTION={'DAYS': 30, 'BATCH_SIZE': 2, 'BATCH_PAUSE': 0})
+class ClickRetentionTests(TestCase):
+    def setUp(self):
+        self.url = Url.objects.create(original_url="https://www.google.com")
+        self.dt_now = timezone.now()
+        self.dt_expired = self.dt_now - datetime.timedelta(days=45)
+
+    def _create_click(self, created_at):
+        return Click.objects.create(url=self.url, browser_id=Browser.intern("Chrome"),
+                                    platform_id=Platform.intern("Windows"),
+                                    created_at=created_at, updated_at=created_at)
+
+    def test_click_month(self):
+        """
+        Test that the clicks are partitioned by the month they were created in
+        """
+        created_at = timezone.make_aware(datetime.datetime(2026, 2, 28, 23, 30))
+        click = self._create_click(created_at)
+        self.assertEqual(click.month, 202602)
+
+        pipeline = ClickPipeline()
+        with override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE):
+            pipeline.record(ClickEvent(self.url.id, "Chrome", "Windows", self.dt_now))
+        self.assertEqual(Click.objects.latest('id').month, Click.month_of(self.dt_now))
+
+    def test_prune_clicks(self):
+        """
+        Test that the expired raw clicks are deleted in batches and their rollups are kept
+        """
+        for _ in range(5):
+            self._create_click(self.dt_expired)
+        recent = self._create_click(self.dt_now)
+
+        # Assert that every batch is deleted in its own transaction
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(prune_clicks(), 5)
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries.captured_queries), 3)
+
+        self.assertEqual(list(Click.objects.values_list('id', flat=True)), [recent.id])
+        self.assertEqual(ClickRollup.objects.get(day=timezone.localdate(self.dt_expired)).count, 5)
+
+        # Assert that the pruned days are not rebuilt from the remaining clicks
+        backfill_click_rollups()
+        self.assertEqual(ClickRollup.objects.get(day=timezone.localdate(self.dt_expired)).count, 5)
+
+    def test_prune_clicks_command(self):
+        """
+        Test that the prune_clicks command deletes the clicks older than the given days
+        """
+        self._create_click(self.dt_expired)
+        self._create_click(self.dt_now - datetime.timedelta(days=5))
+
+        stdout = mock.Mock()
+        call_command('prune_clicks', days=60, stdout=stdout)
+        self.assertEqual(Click.objects.count(), 2)
+
+        call_command('prune_clicks', days=2, batch_size=10, stdout=stdout)
+        self.assertEqual(Click.objects.count(), 0)
+
+
+class UserAgentFamilyTests(TestCase):
+    def setUp(self):
+        Browser.clear_cache()
+        Platform.clear_cache()
+        # The ids cached by the executed commit callbacks are rolled back with the test
+        self.addCleanup(Browser.clear_cache)
+        self.addCleanup(Platform.clear_cache)
+
+    def test_intern(self):
+        """
+        Test that a family name is stored once and its id is cached once committed
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            chrome_id = Browser.intern("Chrome")
+        self.assertEqual(Browser.objects.get(pk=chrome_id).name, "Chrome")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Browser.intern("Chrome"), chrome_id)
+
+        # Assert that the missing families are looked up, created and read back at once
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            ids = Browser.intern_many(["Chrome", "Safari", "Firefox"])
+        self.assertEqual(ids["Chrome"], chrome_id)
+        self.assertEqual(set(Browser.objects.values_list('name', flat=True)), {"Chrome", "Safari", "Firefox"})
+
+    def test_rolled_back_family_is_not_cached(self):
+        """
+        Test that the id of a family created in a rolled back transaction is not cached
+        """
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Browser.intern("Chrome")
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Browser.objects.exists())
+
+        with self.assertNumQueries(3):
+            Browser.intern("Chrome")
+
+
+@override_settings(HEYURL_CLICK_PIPELINE=SYNCHRONOUS_CLICK_PIPELINE)
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        caches['default'].clear()
+
+    def test_seed(self):
+        """
+        Test that the benchmark seeds urls and spreads clicks over them
+        """
+        short_urls = seed(5, 40)
+
+        self.assertEqual(len(short_urls), 5)
+        self.assertEqual(Click.objects.count(), 40)
+        self.assertEqual(sum(Url.objects.values_list('clicks', flat=True)), 40)
+        self.assertEqual(sum(ClickRollup.objects.values_list('count', flat=True)), 40)
+
+    def test_run_scenarios(self):
+        """
+        Test that every scenario is measured
+        """
+        short_urls = seed(3, 10)
+
+        for name, send in scenarios(short_urls).items():
+            result = run_scenario(name, send, requests=4)
+            self.assertEqual(result.requests, 4)
+            self.assertLessEqual(result.p50_ms, result.p99_ms)
+            self.assertGreater(result.throughput, 0)
+
+        self.assertEqual(Click.objects.count(), 14)
+
+    def test_warm_redirects_do_not_query(self):
+        """
+        Test that the redirects of every seeded url run no query once the caches are warm
+        """
+        short_code_filter.reset()
+        short_urls = seed(20, 10)
+        warm_caches(short_urls)
+
+        # Leave the clicks out, they are written out of the requests
+        with mock.patch.object(click_pipeline, 'arecord', new=mock.AsyncMock()):
+            result = run_scenario('redirect', scenarios(short_urls)['redirect'], requests=40)
+        self.assertEqual(result.queries_per_request, 0)
+
+    def test_failed_requests(self):
+        """
+        Test that a scenario fails when its requests fail
+        """
+        with self.assertRaises(RuntimeError):
+            run_scenario('not_found', lambda client, n: client.get('/not-found/'), requests=2)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        caches['default'].clear()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+    def _sample(self, line_start):
+        response = self.client.get(reverse('prometheus-metrics'))
+        self.assertEqual(response['Content-Type'], "text/plain; version=0.0.4; charset=utf-8")
+        for line in response.content.decode().splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.split()[-1])
+        return 0.0
+
+    def test_registry_render(self):
+        """
+        Test that the metrics are rendered in the Prometheus text format
+        """
+        registry = Registry()
+        requests = registry.counter('requests_total', "Requests", ('view',))
+        durations = registry.histogram('duration_seconds', "Durations", ('view',), buckets=(0.1, 1))
+        requests.inc(('index',))
+        durations.observe(('index',), 0.5)
+        durations.observe(('index',), 2)
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{view="index"} 1.0',
+            '# HELP duration_seconds Durations',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{view="index",le="0.1"} 0',
+            'duration_seconds_bucket{view="index",le="1"} 1',
+            'duration_seconds_bucket{view="index",le="+Inf"} 2',
+            'duration_seconds_sum{view="index"} 2.5',
+            'duration_seconds_count{view="index"} 2',
+        ])
+
+    def test_request_metrics(self):
+        """
+        Test that the duration and the queries of the requests are recorded by view
+        """
+        count = self._sample('heyurl_request_duration_seconds_count{view="index",status="200"}')
+        queries = self._sample('heyurl_request_db_queries_sum{view="index"}')
+
+        self.client.get(reverse('index'))
+
+        self.assertEqual(self._sample('heyurl_request_duration_seconds_count{view="index",status="200"}'), count + 1)
+        self.assertEqual(self._sample('heyurl_request_db_queries_sum{view="index"}'), queries + 1)
+
+    def test_async_redirect_metrics(self):
+        """
+        Test that the queries the async redirect view runs in a thread are recorded
+        """
+        queries = self._sample('heyurl_request_db_queries_sum{view="short_url"}')
+        hits = self._sample('heyurl_cache_hits_total{cache="resolution"}')
+        misses = self._sample('heyurl_cache_misses_total{cache="resolution"}')
+
+        with mock.patch.object(click_pipeline, 'record'):
+            self.client.get(reverse('short_url', kwargs={'short_url': self.url.short_url}))
+            self.client.get(reverse('short_url', kwargs={'short_url': self.url.short_url}))
+
+        # Only the first redirect resolves the short url from the database
+        self.assertEqual(self._sample('heyurl_request_db_queries_sum{view="short_url"}'), queries + 1)
+        self.assertEqual(self._sample('heyurl_cache_hits_total{cache="resolution"}'), hits + 1)
+        self.assertEqual(self._sample('heyurl_cache_misses_total{cache="resolution"}'), misses + 1)
+
+
+class ShortCodeFilterTests(TestCase):
+    def setUp(self):
+        resolution_cache.clear()
+        caches['default'].clear()
+        short_code_filter.reset()
+        self.url = Url.objects.create(original_url="https://www.google.com")
+
+    def test_bloom_filter(self):
+        """
+        Test that a Bloom filter has no false negatives and about its false positive rate
+        """
+        bloom = BloomFilter(1000, 0.01)
+        codes = [encode_short_code(n) for n in range(1000)]
+        for code in codes:
+            bloom.add(code)
+
+        self.assertTrue(all(code in bloom for code in codes))
+        false_positives = sum(encode_short_code(n) in bloom for n in range(1000, 11000))
+        self.assertLess(false_positives, 10000 * 0.02)
+
+        with self.assertRaises(ValueError):
+            BloomFilter(1000, 1)
+
+    def test_unknown_short_url_does_not_query(self):
+        """
+        Test that a redirect to an unknown short url is answered with the 404 page from memory
+        """
+        # Build the filter
+        Url.resolve(self.url.short_url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('short_url', kwargs={'short_url': "R4nd0m"}))
+        self.assertContains(response, "404", status_code=404)
+
+    def test_created_short_urls_are_added(self):
+        """
+        Test that the short urls created by the process, one by one or in bulk, are added to the filter
+        """
+        self.assertTrue(short_code_filter.might_exist(self.url.short_url))
+
+        url = Url.objects.create(original_url="https://www.facebook.com")
+        results = shorten_urls(["https://www.twitter.com"])
+
+        with self.assertNumQueries(0):
+            self.assertTrue(short_code_filter.might_exist(url.short_url))
+            self.assertTrue(short_code_filter.might_exist(results[0].url.short_url))
+
+    def test_refresh(self):
+        """
+        Test that the short urls created by the other processes are loaded at most once every refresh interval
+        """
+        codes = iter(range(1, 10 ** 6))
+        rows = []
+        short_codes = ShortCodeFilter(lambda pk: [row for row in rows if row[0] > pk], capacity=100,
+                                      error_rate=0.001, refresh_interval=60, creatable=is_short_code)
+        self.assertFalse(short_codes.might_exist("AAAAA"))
+
+        # Assert that between two refreshes only the short urls which cannot be created are known to not exist
+        rows.append((next(codes), "AAAAA"))
+        self.assertTrue(short_codes.might_exist("AAAAA"))
+        self.assertTrue(short_codes.might_exist("BBBBB"))
+        self.assertFalse(short_codes.might_exist("R4nd0m"))
+        self.assertEqual(short_codes.stats()['count'], 0)
+
+        # Assert that the new short urls are loaded once the refresh interval has elapsed
+        short_codes.refresh_interval = 0
+        self.assertTrue(short_codes.might_exist("AAAAA"))
+        self.assertFalse(short_codes.might_exist("BBBBB"))
+        self.assertEqual(short_codes.stats()['count'], 1)
+
+        # Assert that the filter grows past its capacity
+        rows.extend((next(codes), encode_short_code(n)) for n in range(150))
+        self.assertFalse(short_codes.might_exist("ZZZZZ"))
+        self.assertGreaterEqual(short_codes.stats()['count'], 151)
+        self.assertGreater(short_codes._bloom.capacity, 151)
+
+    def test_short_url_of_another_process_is_resolved(self):
+        """
+        Test that a short url created by another process since the last refresh is resolved from the database
+        """
+        # Build the filter
+        Url.resolve(self.url.short_url)
+
+        # Create the url without adding it to the filter of this process
+        now = timezone.now()
+        Url.objects.bulk_create([Url(original_url="https://www.facebook.com", short_url=encode_short_code(42),
+                                     created_at=now, updated_at=now)])
+
+        with mock.patch.object(short_code_filter, 'refresh_interval', 60):
+            resolved = Url.resolve(encode_short_code(42))
+        self.assertEqual(resolved.original_url, "https://www.facebook.com")
+
+    def test_probes_are_answered_from_memory(self):
+        """
+        Test that with a shared cache the probed short urls are answered from memory until one is created
+        """
+        generator = random.Random(0)
+        probes = {''.join(generator.choice(ALPHABET) for _ in range(CODE_LENGTH)) for _ in range(200)}
+        probes.discard(self.url.short_url)
+
+        with mock.patch.object(short_code_filter, 'cache_alias', 'default'):
+            # Build the filter
+            Url.resolve(self.url.short_url)
+
+            with self.assertNumQueries(0):
+                for short_url in probes:
+                    self.assertIsNone(Url.resolve(short_url))
+
+            # Create a url from another process, which publishes it
+            now = timezone.now()
+            Url.objects.bulk_create([Url(original_url="https://www.facebook.com", short_url=encode_short_code(42),
+                                         created_at=now, updated_at=now)])
+            short_code_filter.publish()
+
+            with mock.patch.object(short_code_filter, 'refresh_interval', 0):
+                self.assertEqual(Url.resolve(encode_short_code(42)).original_url, "https://www.facebook.com")
+            self.assertIn(encode_short_code(42), short_code_filter._bloom)
+
+            # Assert that the probes are answered from memory again once the new short url is loaded
+            with self.assertNumQueries(0):
+                self.assertIsNone(Url.resolve(encode_short_code(43)))
+
+    def test_rebuild_command(self):
+        """
+        Test that the rebuild command drops the deleted short urls and asks the other processes to rebuild
+        """
+        short_url = self.url.short_url
+        self.assertTrue(short_code_filter.might_exist(short_url))
+        self.url.delete()
+
+        stdout = mock.Mock()
+        with mock.patch.object(short_code_filter, 'cache_alias', 'default'):
+            call_command('rebuild_short_code_filter', stdout=stdout)
+        self.assertNotIn(short_url, short_code_filter._bloom)
+        self.assertEqual(short_code_filter.stats()['count'], 0)
+        self.assertIsNotNone(caches['default'].get('heyurl:short-code-filter:generation'))
+
+        # Assert that the command warns that it cannot reach the other processes without a shared cache
+        stdout = mock.Mock()
+        call_command('rebuild_short_code_filter', stdout=stdout)
+        self.assertIn('CACHE_ALIAS', ''.join(call.args[0] for call in stdout.write.call_args_list))
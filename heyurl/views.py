@@ -1,38 +1,176 @@
-from typing import Optional
-
-from django.db.models import Count
-from django.db.models.functions import TruncDay
-from django.shortcuts import render, redirect
+import datetime
+import functools
+import hashlib
+import itertools
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.db.models import OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
 
+from .cache import CACHE_MISS, ResolvedUrl, resolution_cache, user_agent_cache
+from .db import reads_from_replica, stick_to_primary
 from .forms import UrlForm
+from .instrumentation import registry
 from .models import Url, Click
-from .serializers import UrlSerializer
+from .parsers import BulkJSONParser
+from .serializers import BulkUrlSerializer, MetricSerializer, UrlSerializer
+from .services import (ClickEvent, ClickMetrics, KeysetPage, click_pipeline, export_csv, export_ndjson, export_rows,
+                       paginate_by_created_at, shorten_urls)
+
+
+# Format of the time buckets rendered by the metric panel
+PANEL_DATE_FORMATS = {
+    'hour': 'F d, Y H:i',
+    'day': 'F d, Y',
+    'week': 'F d, Y',
+    'month': 'F Y',
+}
+
+
+class HttpResponseSeeOther(HttpResponseRedirect):
+    status_code = 303
+
+
+def _redirect_response(url: ResolvedUrl) -> HttpResponseRedirect:
+    """
+    Redirect to the original url with the redirect status of the url, or the default one
+
+    :param url: ResolvedUrl to redirect to
+    :return: the redirect, cacheable by the browsers and edge caches if it is permanent
+    """
+    status = url.redirect_status or settings.HEYURL_REDIRECT['STATUS']
+    response = HttpResponseRedirect(url.original_url)
+    response.status_code = status
+
+    if status in Url.PERMANENT_REDIRECT_STATUSES:
+        patch_cache_control(response, public=True, max_age=settings.HEYURL_REDIRECT['MAX_AGE'])
+    else:
+        # Every click of a temporary redirect has to reach the server to be tracked
+        patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
+@functools.lru_cache(maxsize=None)
+def _not_found_content() -> bytes:
+    """
+    Render the short url not found page, once per process as it does not depend on the request
+    :return: bytes: the rendered page
+    """
+    return render_to_string('heyurl/short_url_not_found_404.html').encode()
+
+
+def _not_found_response() -> HttpResponseNotFound:
+    """
+    Answer a short url that does not exist with the pre-rendered not found page
+
+    :return: the 404 response, cacheable for a short while as the short url may be created later
+    """
+    response = HttpResponseNotFound(_not_found_content())
+    patch_cache_control(response, public=True, max_age=settings.HEYURL_NOT_FOUND['MAX_AGE'])
+    return response
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    """
+    Parse a date or datetime query parameter
+    :param value: ISO 8601 date or datetime, naive ones are in the current timezone
+    :return: the aware datetime or None if there is no value
+    :raise ValueError: if the value is not valid, or in the first or last year datetime supports
+    """
+    if not value:
+        return None
+
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError('{} is not a valid date'.format(value))
+        parsed = datetime.datetime.combine(date, datetime.time())
+
+    # Leave room to convert the value between timezones and to step to the next time bucket
+    if not datetime.MINYEAR < parsed.year < datetime.MAXYEAR:
+        raise ValueError('{} must be between the years {} and {}'.format(
+            value, datetime.MINYEAR + 1, datetime.MAXYEAR - 1
+        ))
+
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def _etag(*parts) -> str:
+    """
+    Build a strong ETag from the values a response depends on
+    :param parts: the values
+    :return: str: the quoted ETag
+    """
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def _conditional_response(request, etag: str, get_response: Callable[[], HttpResponse], **cache_control):
+    """
+    Answer a 304 when the client has the current version of the response, render it otherwise
+
+    :param request: HttpRequest
+    :param etag: of the current version of the response
+    :param get_response: renders the response
+    :param cache_control: Cache-Control directives of the response
+    :return: the not modified or rendered response
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = get_response()
+
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_cache_control(response, **cache_control)
+    return response
 
 
-def _render_index(request, form: Optional[UrlForm] = None):
+def _render_index(request, form: Optional[UrlForm] = None, page: Optional[KeysetPage] = None):
     """
     Render the index page
 
     :param request: HttpRequest
     :param form: UrlForm
+    :param page: of the urls to list, the first page or the page of the cursor by default
     :return: the rendered index page
     """
-    # List all the urls
-    urls = Url.objects.order_by('-created_at')
+    # List a page of the urls, latest first
+    if page is None:
+        page = paginate_by_created_at(Url.objects.all(), request.GET.get('cursor'), settings.HEYURL_INDEX_PAGE_SIZE)
 
     # Create a new form
     if form is None:
         form = UrlForm()
 
     context = {
-        'urls': urls,
+        'urls': page.items,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
         'form': form
     }
     return render(request, 'heyurl/index.html', context)
 
 
+@reads_from_replica
 def index(request):
     """
     Render the index page
@@ -40,14 +178,23 @@ def index(request):
     :param request: HttpRequest
     :return: the rendered index page
     """
-    return _render_index(request)
+    # List a page of the urls, latest first
+    page = paginate_by_created_at(Url.objects.all(), request.GET.get('cursor'), settings.HEYURL_INDEX_PAGE_SIZE)
+
+    # The page only changes with its urls
+    etag = _etag('index', request.GET.get('cursor'), page.next_cursor,
+                 [(url.pk, url.updated_at, url.clicks) for url in page.items])
+
+    # The page embeds a CSRF token, so it is only cached by the browser
+    return _conditional_response(request, etag, lambda: _render_index(request, page=page),
+                                 private=True, max_age=0, must_revalidate=True)
 
 
 def store(request):
     """
     Validate the form and store the url
     :param request: HttpRequest
-    :return: the rendered index page
+    :return: a redirect to the index page, or the rendered index page with the errors
     """
     form = UrlForm(request.POST)
 
@@ -59,11 +206,17 @@ def store(request):
         error_message = Url.is_valid_url(cleaned_data['original_url'])
 
         if error_message is None:
-            # Store the url
-            Url.objects.create(
-                original_url=cleaned_data['original_url'],
-            )
-            return _render_index(request)
+            try:
+                # Store the url
+                Url.objects.create(
+                    original_url=cleaned_data['original_url'],
+                )
+                # Redirect to the index so reloading it does not submit the form again, the
+                # index reads from the primary until the replica has the new url
+                return stick_to_primary(HttpResponseSeeOther(reverse('index')))
+            except IntegrityError:
+                # The original_url is unique
+                error_message = 'The Original URL already exists!'
 
         # Add the error message to the form
         form.add_error('original_url', error_message)
@@ -72,73 +225,275 @@ def store(request):
     return _render_index(request, form)
 
 
-def short_url_click(request, short_url):
+async def short_url_click(request, short_url):
     """
-    Redirect to the original url if the short url exists
+    Redirect to the original url if the short url exists, the database is only queried on a resolution cache miss
     :param request: HttpRequest
     :param short_url: the short url clicked
     :return: the original url redirect
     """
-    url = Url.objects.filter(short_url=short_url).first()
+    # The in-process cache is read from the event loop, the shared cache and the database from a thread
+    url = resolution_cache.local.get(short_url, CACHE_MISS)
+    if url is CACHE_MISS:
+        url = await sync_to_async(Url.resolve)(short_url, skip_local=True)
+
     if url is None:
-        return render(request, 'heyurl/short_url_not_found_404.html')
+        return _not_found_response()
+
+    # Get the browser and platform from the user agent
+    user_agent = user_agent_cache.classify(request.META.get('HTTP_USER_AGENT', ''))
 
-    url.clicks += 1
-    url.save()
+    # Enqueue the click, it is written out of the request by the click pipeline
+    await click_pipeline.arecord(ClickEvent(
+        url_id=url.id,
+        browser=user_agent.browser,
+        platform=user_agent.platform,
+        created_at=timezone.now(),
+    ))
 
-    dt_now = timezone.now()
+    return _redirect_response(url)
 
-    Click.objects.create(
-        url=url,
-        browser=request.user_agent.browser.family,
-        platform=request.user_agent.os.family,
-        created_at=dt_now,
-        updated_at=dt_now
-    )
 
-    return redirect(url.original_url)
+def _click_metrics(request, url_id: int) -> ClickMetrics:
+    """
+    Get the click metrics of a url for the from, to and granularity query parameters
+
+    :param request: HttpRequest
+    :param url_id: of the url
+    :return: ClickMetrics, of the current month per day by default
+    :raise ValueError: if the query parameters are not valid
+    """
+    # Get the first day of the current month and of the next month
+    first_day = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month_first_day = timezone.make_aware((first_day.replace(tzinfo=None) + datetime.timedelta(days=32))
+                                               .replace(day=1))
+
+    start = _parse_datetime(request.GET.get('from')) or first_day
+    end = _parse_datetime(request.GET.get('to')) or next_month_first_day
+    return ClickMetrics(url_id, start, end, request.GET.get('granularity', 'day'))
 
 
+@reads_from_replica
 def metric_panel(request, short_url):
     """
     Render the metric panel page
 
-    :param request: HttpRequest
+    :param request: HttpRequest with the optional from, to and granularity query parameters
     :param short_url: the short url clicked
     :return: the rendered metric panel page
     """
-    url = Url.objects.filter(short_url=short_url).first()
+    url = Url.resolve(short_url)
     if url is None:
-        return render(request, 'heyurl/short_url_not_found_404.html')
+        return _not_found_response()
+
+    try:
+        metrics = _click_metrics(request, url.id)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    # The metrics only change with the url, its clicks and the requested time range
+    version = Url.objects.filter(pk=url.id).annotate(last_click_at=Subquery(
+        Click.objects.filter(url_id=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    )).values_list('updated_at', 'clicks', 'last_click_at').first()
+    # The period is part of the page, it is named after the month when no time range is requested
+    etag = _etag('metric-panel', url.id, metrics.start, metrics.end, metrics.granularity,
+                 _metric_panel_period(request, metrics), version)
 
-    dt_now = timezone.now()
-    # Get the first day of the current month
-    first_day = dt_now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    # Get the first day of the next month and subtract 1 day to get the last day of the current month
-    last_day = dt_now.replace(month=dt_now.month + 1, day=1, hour=23, minute=59, second=59, microsecond=999999)
-    last_day = last_day - timezone.timedelta(days=1)
+    def render_metric_panel():
+        cache = caches[settings.HEYURL_METRIC_PANEL_CACHE['CACHE_ALIAS']]
+        cache_key = 'heyurl:metric-panel:{}'.format(etag.strip('"'))
+        content = cache.get(cache_key)
+        if content is not None:
+            return HttpResponse(content)
 
-    # Get all the clicks for the current month
-    clicks = list(Click.objects.filter(url=url, created_at__range=[first_day, last_day])
-                  .annotate(date=TruncDay('created_at')).values('date').annotate(count=Count('id'))
-                  .values('date', 'count'))
+        response = _render_metric_panel(request, short_url, metrics)
+        cache.set(cache_key, response.content, settings.HEYURL_METRIC_PANEL_CACHE['TTL'])
+        return response
 
-    # Get all the user agents for the current month
-    user_agents = list(Click.objects.filter(url=url, created_at__range=[first_day, last_day])
-                       .values('browser', 'platform'))
+    return _conditional_response(request, etag, render_metric_panel, public=True, max_age=0, must_revalidate=True)
+
+
+def _metric_panel_period(request, metrics: ClickMetrics) -> str:
+    """
+    Describe the time range of the metric panel
+    :param request: HttpRequest with the optional from and to query parameters
+    :param metrics: ClickMetrics rendered by the panel
+    :return: str: the requested time range, or the current month if there is none
+    """
+    if request.GET.get('from') or request.GET.get('to'):
+        last_day = timezone.localtime(metrics.end - datetime.timedelta(microseconds=1))
+        return '{} - {}'.format(timezone.localtime(metrics.start).strftime('%B %d, %Y'),
+                                last_day.strftime('%B %d, %Y'))
+    return 'this {}'.format(timezone.localtime(metrics.start).strftime('%B'))
+
+
+def _render_metric_panel(request, short_url: str, metrics: ClickMetrics):
+    """
+    Render the metric panel page
+
+    :param request: HttpRequest
+    :param short_url: the short url clicked
+    :param metrics: ClickMetrics to render
+    :return: the rendered metric panel page
+    """
+    # Get the clicks per time bucket, including the ones without clicks
+    clicks = metrics.series()
+
+    # Get the clicks per user agent
+    user_agents = metrics.user_agents(settings.HEYURL_METRICS_TOP_USER_AGENTS)
 
     context = {
         'clicks': clicks,
+        'total_clicks': sum(bucket.count for bucket in clicks),
         'user_agents': user_agents,
         'short_url': short_url,
-        'month': dt_now.strftime('%B'),
+        'granularity': metrics.granularity,
+        'date_format': PANEL_DATE_FORMATS[metrics.granularity],
+        'period': _metric_panel_period(request, metrics),
     }
     return render(request, 'heyurl/metric_panel.html', context)
 
 
+@reads_from_replica
+def click_export(request):
+    """
+    Stream the clicks as NDJSON or CSV, optionally filtered by short url and time range.
+
+    Django iterates the streamed responses on the event loop under ASGI, where the
+    queries are not allowed, so there the view reads the clicks itself, up to
+    HEYURL_CLICK_EXPORT_ASGI_MAX_ROWS of them.
+
+    :param request: HttpRequest with the format (ndjson or csv), short_url, from and to query parameters
+    :return: the streamed clicks
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return HttpResponseBadRequest('The format must be ndjson or csv')
+
+    try:
+        start = _parse_datetime(request.GET.get('from'))
+        end = _parse_datetime(request.GET.get('to'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    url_id = None
+    if request.GET.get('short_url'):
+        url = Url.resolve(request.GET['short_url'])
+        if url is None:
+            return _not_found_response()
+        url_id = url.id
+
+    rows = export_rows(url_id, start, end)
+    buffered = isinstance(request, ASGIRequest)
+    if buffered:
+        max_rows = settings.HEYURL_CLICK_EXPORT_ASGI_MAX_ROWS
+        rows = list(itertools.islice(rows, max_rows + 1))
+        if len(rows) > max_rows:
+            return HttpResponseBadRequest('The export has more than {} clicks, request a shorter time range'
+                                          .format(max_rows))
+
+    lines = export_csv(rows) if export_format == 'csv' else export_ndjson(rows)
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if buffered:
+        response = HttpResponse(''.join(lines), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+
+    if export_format == 'csv':
+        response['Content-Disposition'] = 'attachment; filename="clicks.csv"'
+    return response
+
+
+def prometheus_metrics(request):
+    """
+    Expose the request, database and cache metrics of the process
+    :param request: HttpRequest
+    :return: the metrics in the Prometheus text exposition format
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class UrlViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     API endpoint to list the last 10 created urls in the database
     """
-    queryset = Url.objects.all().order_by('-created_at')[0:10]
     serializer_class = UrlSerializer
+
+    @staticmethod
+    def _recent_clicks_prefetch() -> Prefetch:
+        # Prefetch the latest clicks of every url in one query, capped by url
+        latest_click_ids = Click.objects.filter(url_id=OuterRef('url_id')).order_by('-id').values('id')
+        recent_clicks = Click.objects.filter(
+            id__in=Subquery(latest_click_ids[:settings.HEYURL_URL_METRICS_LIMIT])
+        ).only('id', 'url_id').order_by('-id')
+        return Prefetch('click_set', queryset=recent_clicks, to_attr='recent_clicks')
+
+    def get_queryset(self):
+        queryset = Url.objects.order_by('-created_at')
+        if self.action == 'list':
+            return queryset.prefetch_related(self._recent_clicks_prefetch())[0:10]
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['site_domain'] = get_current_site(self.request).domain
+        return context
+
+    @method_decorator(reads_from_replica)
+    def list(self, request, *args, **kwargs):
+        # The listing only changes with the urls and their latest clicks
+        versions = list(Url.objects.order_by('-created_at').annotate(last_click_id=Subquery(
+            Click.objects.filter(url_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+        )).values_list('id', 'updated_at', 'clicks', 'last_click_id')[0:10])
+        etag = _etag('urls', request.get_full_path(), versions)
+
+        list_urls = super().list
+        return _conditional_response(request, etag, lambda: list_urls(request, *args, **kwargs),
+                                     public=True, max_age=0, must_revalidate=True)
+
+    @action(detail=False, methods=['post'], parser_classes=[BulkJSONParser])
+    def bulk(self, request):
+        """
+        Shorten an array of urls resource objects, answering the created and existing urls along
+        with the result of every item
+        """
+        original_urls = [item.get('original_url') for item in request.data]
+        if len(original_urls) > settings.HEYURL_BULK_SHORTEN_MAX_ITEMS:
+            raise ValidationError('At most {} urls can be shortened at once'.format(
+                settings.HEYURL_BULK_SHORTEN_MAX_ITEMS
+            ))
+
+        results = shorten_urls(original_urls)
+
+        urls = list({result.url.pk: result.url for result in results if result.url is not None}.values())
+        prefetch_related_objects(urls, self._recent_clicks_prefetch())
+
+        context = self.get_serializer_context()
+        context['results'] = [
+            {'status': result.status, 'id': str(result.url.pk)} if result.url is not None
+            else {'status': result.status, 'detail': result.error}
+            for result in results
+        ]
+        return stick_to_primary(Response(BulkUrlSerializer(urls, many=True, context=context).data))
+
+    @action(detail=True, serializer_class=MetricSerializer)
+    @method_decorator(reads_from_replica)
+    def metrics(self, request, pk=None):
+        """
+        Count the clicks of a url per time bucket, for the from, to and granularity query parameters
+        """
+        # Get the url without the filter backends, which only accept the JSON:API query parameters,
+        # an invalid pk is not found
+        try:
+            url = get_object_or_404(self.get_queryset(), pk=pk)
+        except OverflowError:
+            raise Http404
+
+        try:
+            metrics = _click_metrics(request, url.pk)
+        except ValueError as error:
+            raise ValidationError(str(error))
+
+        context = self.get_serializer_context()
+        context['metrics'] = metrics
+        return Response(MetricSerializer(metrics.series(), many=True, context=context).data)
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'heyurl.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,7 +51,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django_user_agents.middleware.UserAgentMiddleware',
 ]
 
 ROOT_URLCONF = 'urls.urls'
@@ -59,8 +59,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # The templates are compiled once per process, even with DEBUG
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -80,9 +86,28 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Keep the connections open between requests, in seconds
+        'CONN_MAX_AGE': int(os.environ.get('HEYURL_DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            # Seconds a connection waits for a lock before raising "database is locked"
+            'timeout': int(os.environ.get('HEYURL_SQLITE_BUSY_TIMEOUT', 20000)) / 1000,
+        },
+    },
 }
 
+# Read replica of the default database, used by the listing and metric reads when
+# HEYURL_REPLICA_DB_NAME is set. It mirrors the default database in the tests.
+if os.environ.get('HEYURL_REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['HEYURL_REPLICA_DB_NAME'],
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+
+DATABASE_ROUTERS = ['heyurl.db.routers.ReplicaRouter']
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 # Password validation
@@ -150,3 +175,134 @@ REST_FRAMEWORK = {
     ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'vnd.api+json'
 }
+
+# HeyURL
+
+# Short url resolution cache used by the redirect path. Set CACHE_ALIAS to one of
+# the CACHES aliases to share the resolutions between workers.
+HEYURL_RESOLUTION_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'NEGATIVE_TTL': 30,
+    'CACHE_ALIAS': None,
+}
+
+# Click ingestion. The redirects enqueue the clicks and a background worker writes
+# them in batches of FLUSH_SIZE or every FLUSH_INTERVAL seconds. Disable ASYNC to
+# write the clicks during the redirect request.
+HEYURL_CLICK_PIPELINE = {
+    'ASYNC': True,
+    'FLUSH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Number of short urls leased by each process at a time
+HEYURL_SHORT_URL_BLOCK_SIZE = 100
+
+# Number of browser and platform pairs listed by the metric panel, the rest are counted as other
+HEYURL_METRICS_TOP_USER_AGENTS = 10
+
+# Number of time buckets the click metrics may have, longer time ranges must use a coarser
+# granularity. 2000 buckets are 83 days per hour or 5 years per day.
+HEYURL_METRICS_MAX_BUCKETS = 2000
+
+# Number of parsed user agents kept in memory
+HEYURL_USER_AGENT_CACHE_SIZE = 1000
+
+# Number of URLs listed by page on the index page
+HEYURL_INDEX_PAGE_SIZE = 25
+
+# Number of latest metrics related to each URL by the urls API endpoint
+HEYURL_URL_METRICS_LIMIT = 10
+
+# Maximum number of URLs shortened by a bulk request
+HEYURL_BULK_SHORTEN_MAX_ITEMS = 10000
+
+# Number of clicks fetched from the database at a time by the click export
+HEYURL_CLICK_EXPORT_CHUNK_SIZE = 2000
+
+# Number of clicks the click export reads in memory under ASGI, where Django cannot stream
+# a response reading from the database. Larger exports must use shorter time ranges, or WSGI.
+HEYURL_CLICK_EXPORT_ASGI_MAX_ROWS = 100000
+
+# Cache of the rendered metric panels, keyed by their ETag so a cached panel is never stale
+HEYURL_METRIC_PANEL_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 30,
+}
+
+# Redirect of the short urls without a redirect status of their own. A permanent STATUS
+# (301 or 308) lets the browsers and edge caches keep the redirect for MAX_AGE seconds,
+# so only the clicks reaching the server are tracked. Use 302 or 307 to track every click.
+HEYURL_REDIRECT = {
+    'STATUS': 302,
+    'MAX_AGE': 3600,
+}
+
+# Cache lifetime, in seconds, of the 404 page of the unknown short urls. Keep it short,
+# a short url can be created after a miss.
+HEYURL_NOT_FOUND = {
+    'MAX_AGE': 60,
+}
+
+# Pragmas applied to every new SQLite connection. The journal mode is stored in the
+# database file, so it is only changed when HEYURL_SQLITE_JOURNAL_MODE is set: set it to
+# wal on the servers to let the readers run alongside a writer. Synchronous NORMAL only
+# syncs at the checkpoints of the WAL journal and is only safe with it, the rollback
+# journal needs FULL to survive a power loss. The busy timeout (in milliseconds) makes
+# the writers wait for each other.
+HEYURL_SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.environ.get('HEYURL_SQLITE_BUSY_TIMEOUT', 20000)),
+    'mmap_size': int(os.environ.get('HEYURL_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+if os.environ.get('HEYURL_SQLITE_JOURNAL_MODE'):
+    HEYURL_SQLITE_PRAGMAS['journal_mode'] = os.environ['HEYURL_SQLITE_JOURNAL_MODE']
+HEYURL_SQLITE_PRAGMAS['synchronous'] = os.environ.get(
+    'HEYURL_SQLITE_SYNCHRONOUS', 'normal' if HEYURL_SQLITE_PRAGMAS.get('journal_mode', '').lower() == 'wal' else 'full'
+)
+
+# Database alias of the read replica, reads fall back to the default database when it is
+# not configured. After a write the client reads from the default database for
+# STICKY_SECONDS, so it reads its own writes while the replica catches up.
+HEYURL_REPLICA = {
+    'ALIAS': 'replica',
+    'STICKY_COOKIE': 'heyurl_primary',
+    'STICKY_SECONDS': 10,
+}
+
+# Retention of the raw clicks, older ones are deleted by the prune_clicks command in
+# transactions of BATCH_SIZE clicks, sleeping BATCH_PAUSE seconds in between. Their
+# counts are kept by the daily rollups. Set DAYS to None to retain them forever.
+HEYURL_CLICK_RETENTION = {
+    'DAYS': int(os.environ.get('HEYURL_CLICK_RETENTION_DAYS', 400)),
+    'BATCH_SIZE': 1000,
+    'BATCH_PAUSE': 0.1,
+}
+
+# Regression thresholds enforced by the benchmark command, by scenario: the mean number
+# of queries per request with warm caches and, optionally, the 99th percentile latency in
+# milliseconds (P99_MS). The latencies vary a lot between machines, so they are only
+# reported; add P99_MS thresholds measured on the machine running the benchmark.
+HEYURL_BENCHMARK_THRESHOLDS = {
+    'redirect': {'QUERIES': 0.5},
+    'create': {'QUERIES': 3.5},
+    'index': {'QUERIES': 1},
+    'metric_panel': {'QUERIES': 4},
+    'urls_api': {'QUERIES': 3.5},
+}
+
+# Bloom filter of the short urls, answering the unknown ones without querying the
+# database. It is sized for CAPACITY short urls or twice the stored ones with a false
+# positive rate of ERROR_RATE, and loads the short urls created by the other processes
+# at most every REFRESH_INTERVAL seconds. Set CACHE_ALIAS to one of the CACHES aliases
+# shared between the processes, such as a Memcached or Redis cache: the processes then
+# publish their new short urls there and the unknown ones are answered from memory, and
+# the rebuild_short_code_filter command reaches every process. Without it, only the
+# short urls which cannot be allocated are answered from memory.
+HEYURL_SHORT_CODE_FILTER = {
+    'ENABLED': True,
+    'CAPACITY': 1000000,
+    'ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 1.0,
+    'CACHE_ALIAS': None,
+}